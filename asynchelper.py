@@ -1,8 +1,38 @@
 from concurrent.futures import Future, ThreadPoolExecutor
 from flask import render_template
+from os import environ
+from threading import Lock
+
+#every promise runs on the same threads so that a busy server doesn't start new ones for each query, a promise that
+#waits for other promises only waits for ones made before it, which the executor has already started
+threads = int(environ.get('PROMISE_THREADS', 8))
+executor = ThreadPoolExecutor(threads)
+lock = Lock()
+queue = {'queued': 0, 'running': 0, 'max_queued': 0, 'completed': 0}
+
+def run(fn, *args, **kwargs):
+    with lock:
+        queue['queued'] -= 1
+        queue['running'] += 1
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        with lock:
+            queue['running'] -= 1
+            queue['completed'] += 1
+
+def submit(fn, *args, **kwargs):
+    with lock:
+        queue['queued'] += 1
+        queue['max_queued'] = max(queue['max_queued'], queue['queued'])
+    return executor.submit(run, fn, *args, **kwargs)
 
 def promise(fn):
-    return lambda *args, **kwargs: ThreadPoolExecutor(1).submit(fn, *args, **kwargs)
+    return lambda *args, **kwargs: submit(fn, *args, **kwargs)
+
+def promise_statistics():
+    with lock:
+        return dict(queue, threads=threads)
 
 def render_template_async(*args, **kwargs):
     for key in kwargs:
@@ -4,25 +4,86 @@ import gzip
 import re
 from asynchelper import promise, render_template_async
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from db import DB
+from db import DB, close_dbs
 from flask import Flask
 from flask import Response
 from flask import abort
+from flask import g
 from flask import redirect
 from flask import render_template
 from flask import request
 from hashlib import sha256
-from os import environ
-from urllib.parse import urlparse, quote
-from werkzeug.contrib.cache import FileSystemCache
-from werkzeug.contrib.cache import NullCache
+from os import environ, listdir, remove
+from os.path import isdir
+from responsecache import ResponseCache
+from shutil import rmtree
+from threading import Lock, Thread
+from urllib.parse import urlencode, urlparse, quote
 from werkzeug.routing import BaseConverter
+from werkzeug.wsgi import wrap_file
 
 app = Flask(__name__)
-ttl = float(environ.get('TTL', 0)) #zero means infinity to the FileSystemCache
-cache = FileSystemCache('/tmp/clinvar-miner', threshold=1000000) if ttl >= 0 else NullCache()
-cache.clear() #delete the cache when the webserver is restarted
+ttl = float(environ.get('TTL', 0)) #zero means infinity to the ResponseCache
+cache_dir = '/tmp/clinvar-miner'
+memory_cache_size = int(environ.get('MEMORY_CACHE_SIZE', 67108864))
+disk_cache_size = int(environ.get('DISK_CACHE_SIZE', 4294967296))
+large_page_size = int(environ.get('LARGE_PAGE_SIZE', 1048576)) #sent from the file instead of being kept in memory
+render_wait = float(environ.get('RENDER_WAIT', 30)) #seconds to wait for another request rendering the same page
+max_stale = float(environ.get('MAX_STALE', 0)) #seconds to keep serving an expired page while it is rendered again
+revalidator = ThreadPoolExecutor(int(environ.get('REVALIDATE_THREADS', 2)))
+caches = {}
+caches_lock = Lock()
+
+def get_cache():
+    #each generation of the database has its own directory of pages, so the pages outlast restarts of the webserver
+    #but not imports
+    generation = DB().generation()
+    if ttl < 0 or not generation:
+        return None
+    with caches_lock:
+        if generation not in caches:
+            caches.clear()
+            caches[generation] = ResponseCache(
+                cache_dir + '/' + generation, memory_cache_size, disk_cache_size, large_page_size, max_stale
+            )
+            Thread(target=delete_old_caches, args=[generation], daemon=True).start()
+        return caches[generation]
+
+def delete_old_caches(generation):
+    #other webserver processes may be deleting the same files
+    for name in listdir(cache_dir):
+        if name != generation:
+            try:
+                if isdir(cache_dir + '/' + name):
+                    rmtree(cache_dir + '/' + name)
+                else:
+                    remove(cache_dir + '/' + name)
+            except OSError:
+                pass
+
+def cache_key():
+    #the same page is cached once whatever order its parameters are in
+    return request.host + request.script_root + request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+
+def revalidate(cache, key, url_root, path, query_string):
+    #request the expired page again in the background, marked so that cache_get renders it instead of serving it
+    revalidated = False
+    try:
+        response = app.test_client().get(
+            path,
+            base_url=url_root,
+            query_string=query_string,
+            headers={'Accept-Encoding': 'gzip'},
+            environ_overrides={'clinvar_miner.revalidate': True},
+        )
+        revalidated = response.status_code == 200
+    except Exception:
+        #the executor would keep the exception in a future that nobody looks at
+        app.logger.exception('Could not render ' + path + ' again')
+    finally:
+        cache.finish_revalidation(key, revalidated)
 
 app.jinja_env.trim_blocks = True
 app.jinja_env.lstrip_blocks = True
@@ -157,110 +218,40 @@ def get_conflict_breakdown(total_variants_in_conflict_by_significance_and_signif
     return breakdown
 
 @promise
-def get_conflict_summary_by_condition(total_variants_by_condition, total_variants_potentially_in_conflict_by_condition,
-                                      total_variants_in_conflict_by_condition,
-                                      total_variants_in_conflict_by_condition_and_conflict_level):
-    summary = OrderedDict()
-
-    for row in total_variants_in_conflict_by_condition.result():
-        condition_name = row['condition_name']
-        count = row['count']
-        summary[condition_name] = {'any_conflict': count}
-
-    for row in total_variants_potentially_in_conflict_by_condition.result():
-        condition_name = row['condition_name']
-        if condition_name in summary: #some conditions have no conflicts at all
-            count = row['count']
-            summary[condition_name][0] = count - summary[condition_name]['any_conflict']
-
-    for row in total_variants_by_condition.result():
-        condition_name = row['condition_name']
-        if condition_name in summary: #some conditions have no conflicts at all
-            count = row['count']
-            summary[condition_name][-1] = count - summary[condition_name][0] - summary[condition_name]['any_conflict']
-
-    for row in total_variants_in_conflict_by_condition_and_conflict_level.result():
-        condition_name = row['condition_name']
-        conflict_level = row['conflict_level']
-        count = row['count']
-        summary[condition_name][conflict_level] = count
-
-    return summary
-
-@promise
-def get_conflict_summary_by_gene(total_variants_by_gene, total_variants_potentially_in_conflict_by_gene,
-                                 total_variants_in_conflict_by_gene,
-                                 total_variants_in_conflict_by_gene_and_conflict_level):
+def get_conflict_summary(total_variants_by_conflict_threshold, key_column):
     summary = OrderedDict()
 
-    for row in total_variants_in_conflict_by_gene.result():
-        gene = row['gene']
-        count = row['count']
-        summary[gene] = {'any_conflict': count}
-
-    for row in total_variants_potentially_in_conflict_by_gene.result():
-        gene = row['gene']
-        if gene in summary: #some genes have no conflicts at all
-            count = row['count']
-            summary[gene][0] = count - summary[gene]['any_conflict']
-
-    for row in total_variants_by_gene.result():
-        gene = row['gene']
-        if gene in summary: #some genes have no conflicts at all
-            count = row['count']
-            summary[gene][-1] = count - summary[gene][0] - summary[gene]['any_conflict']
-
-    for row in total_variants_in_conflict_by_gene_and_conflict_level.result():
-        gene = row['gene']
-        conflict_level = row['conflict_level']
-        count = row['count']
-        summary[gene][conflict_level] = count
-
-    return summary
-
-@promise
-def get_conflict_summary_by_submitter(total_variants_by_submitter, total_variants_potentially_in_conflict_by_submitter,
-                                      total_variants_in_conflict_by_submitter,
-                                      total_variants_in_conflict_by_submitter_and_conflict_level):
-    summary = OrderedDict()
-
-    for row in total_variants_in_conflict_by_submitter.result():
-        submitter_id = row['submitter_id']
-        submitter_name = row['submitter_name']
-        count = row['count']
-        summary[submitter_id] = {'name': submitter_name, 'any_conflict': count}
-
-    for row in total_variants_potentially_in_conflict_by_submitter.result():
-        submitter_id = row['submitter_id']
-        if submitter_id in summary: #some submitters have no conflicts with anyone
-            count = row['count']
-            summary[submitter_id][0] = count - summary[submitter_id]['any_conflict']
-
-    for row in total_variants_by_submitter.result():
-        submitter_id = row['submitter_id']
-        if submitter_id in summary: #some submitters have no conflicts with anyone
-            count = row['count']
-            summary[submitter_id][-1] = count - summary[submitter_id][0] - summary[submitter_id]['any_conflict']
-
-    for row in total_variants_in_conflict_by_submitter_and_conflict_level.result():
-        submitter_id = row['submitter_id']
-        conflict_level = row['conflict_level']
-        count = row['count']
-        summary[submitter_id][conflict_level] = count
+    #only the rows with conflicts at the minimum conflict level are returned
+    for row in total_variants_by_conflict_threshold.result():
+        key = row[key_column]
+        summary[key] = {
+            -1: row['total'] - row['potentially_in_conflict'],
+            0: row['potentially_in_conflict'] - row['in_conflict'],
+            'any_conflict': row['in_conflict'],
+        }
+        if 'submitter_name' in row:
+            summary[key]['name'] = row['submitter_name']
+        for conflict_level in range(1, 6):
+            if row['level' + str(conflict_level)]:
+                summary[key][conflict_level] = row['level' + str(conflict_level)]
 
     return summary
 
 @promise
-def get_conflict_overview(total_variants_in_conflict_by_conflict_level):
+def get_conflict_overview(total_variants_by_conflict_threshold):
     overview = {}
 
-    for row in total_variants_in_conflict_by_conflict_level.result():
-        conflict_level = row['conflict_level']
-        count = row['count']
-        overview[conflict_level] = count
+    totals = total_variants_by_conflict_threshold.result()
+    for conflict_level in range(1, 6):
+        if totals['level' + str(conflict_level)]:
+            overview[conflict_level] = totals['level' + str(conflict_level)]
 
     return overview
 
+@promise
+def get_conflict_total(total_variants_by_conflict_threshold, column):
+    return total_variants_by_conflict_threshold.result()[column]
+
 @promise
 def get_significance_overview(total_variants_by_significance):
     overview = {
@@ -493,28 +484,65 @@ def template_functions():
 
 @app.before_request
 def cache_get():
-    response = cache.get(request.url)
-    if not response or 'gzip' not in request.accept_encodings:
+    #only pages are cached, so static files, robots.txt and unknown addresses don't wait for each other
+    g.cache = get_cache() if request.endpoint not in [None, 'static', 'robots_txt'] else None
+    if not g.cache or 'gzip' not in request.accept_encodings:
+        return None
+
+    if request.environ.get('clinvar_miner.revalidate'):
+        #another process may already be rendering the expired page
+        g.release_render = g.cache.lock_page(cache_key(), 0)[0]
+        return None if g.release_render else Response(status=204)
+
+    page, g.release_render = g.cache.get_or_lock(cache_key(), render_wait)
+    if not page:
         return None
 
-    server_etag = response.get_etag()[0]
+    #the page may have expired, so cache_set can't tell that it came from the cache
+    g.cached = True
+    headers, body, stale = page
+    if stale and g.cache.start_revalidation(cache_key()):
+        revalidator.submit(revalidate, g.cache, cache_key(), request.url_root, request.path, request.query_string.decode())
+    server_etag = dict(headers)['ETag'].strip('"')
     client_etags = request.if_none_match
     if server_etag in client_etags:
+        if not isinstance(body, bytes):
+            body[0].close()
         return Response(status=304, headers={'ETag': server_etag})
 
+    if isinstance(body, bytes):
+        return Response(body, headers=headers)
+
+    #large pages go from the cache file to the client without being read into memory, using sendfile if the webserver
+    #supports it
+    f, length = body
+    response = Response(wrap_file(request.environ, f), headers=headers, direct_passthrough=True)
+    response.content_length = length
     return response
 
 @app.after_request
 def cache_set(response):
-    if (ttl >= 0 and not cache.has(request.url) and response.status_code == 200 and not response.direct_passthrough and
-            'gzip' in request.accept_encodings):
+    if (g.cache and not g.get('cached') and response.status_code == 200 and not response.direct_passthrough and
+            'gzip' in request.accept_encodings and not g.cache.has(cache_key())):
         response.set_data(gzip.compress(response.get_data()))
         response.set_etag(sha256(response.get_data()).hexdigest())
         response.headers.set('Content-Encoding', 'gzip')
-        response.freeze()
-        cache.set(request.url, response, timeout=ttl)
+        headers = list(filter(lambda header: header[0] != 'Content-Length', response.headers.items()))
+        g.cache.set(cache_key(), headers, response.get_data(), ttl)
     return response
 
+@app.teardown_request
+def cache_release(exception):
+    #let the requests waiting for this page read it from the cache, or render it themselves if it wasn't cached
+    release_render = g.pop('release_render', None)
+    if release_render:
+        release_render()
+
+@app.teardown_request
+def db_release(exception):
+    #the exception's traceback can keep the request's DB objects, and with them their connections, from being collected
+    close_dbs()
+
 @app.route('/variants-in-conflict-by-condition')
 @app.route('/variants-in-conflict-by-condition/<superescaped:condition_name>')
 def variants_in_conflict_by_condition(condition_name = None):
@@ -532,42 +560,23 @@ def variants_in_conflict_by_condition(condition_name = None):
 
     if condition_name == None:
         args['condition1_name'] = list_arg('conditions')
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-condition.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-            summary=get_conflict_summary_by_condition(
-                DB().total_variants_by_condition(
-                    **args
-                ),
-                DB().total_variants_by_condition(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_condition(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_condition_and_conflict_level(
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
+            total_variants_in_conflict=get_conflict_total(totals, 'in_conflict'),
+            summary=get_conflict_summary(
+                DB().total_variants_by_condition_and_conflict_threshold(
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                'condition_name',
             ),
         )
 
@@ -576,46 +585,30 @@ def variants_in_conflict_by_condition(condition_name = None):
     args['condition1_name'] = condition_name
     args['original_terms'] = request.args.get('original_terms')
 
+    totals = DB().total_variants_by_conflict_threshold(
+        min_conflict_level=min_conflict_level,
+        **args
+    )
     return render_template_async(
         'variants-in-conflict-by-condition--condition.html',
         condition_name=condition_name,
         condition_xrefs=DB().condition_xrefs(condition_name, args['date']),
         min_conflict_level=min_conflict_level,
-        overview=get_conflict_overview(
-            DB().total_variants_in_conflict_by_conflict_level(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-        ),
-        total_variants=DB().total_variants(
-            **args
-        ),
-        total_variants_potentially_in_conflict=DB().total_variants(
-            min_conflict_level=0,
-            **args
-        ),
+        overview=get_conflict_overview(totals),
+        total_variants=get_conflict_total(totals, 'total'),
+        total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
         breakdown=get_conflict_breakdown(
             DB().total_variants_in_conflict_by_significance_and_significance(
                 min_conflict_level=min_conflict_level,
                 **args
             )
         ),
-        summary=get_conflict_summary_by_condition(
-            DB().total_variants_by_condition(
-                **args
-            ),
-            DB().total_variants_by_condition(
-                min_conflict_level=0,
-                **args
-            ),
-            DB().total_variants_by_condition(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-            DB().total_variants_in_conflict_by_condition_and_conflict_level(
+        summary=get_conflict_summary(
+            DB().total_variants_by_condition_and_conflict_threshold(
                 min_conflict_level=min_conflict_level,
                 **args
             ),
+            'condition_name',
         ),
         variants=DB().variants(
             min_conflict_level=min_conflict_level,
@@ -642,42 +635,23 @@ def variants_in_conflict_by_gene(gene = None, significance1 = None, significance
 
     if not gene:
         args['gene'] = list_arg('genes')
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-gene.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-            summary=get_conflict_summary_by_gene(
-                DB().total_variants_by_gene(
-                    **args
-                ),
-                DB().total_variants_by_gene(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_gene(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_gene_and_conflict_level(
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
+            total_variants_in_conflict=get_conflict_total(totals, 'in_conflict'),
+            summary=get_conflict_summary(
+                DB().total_variants_by_gene_and_conflict_threshold(
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                'gene',
             ),
         )
 
@@ -690,23 +664,17 @@ def variants_in_conflict_by_gene(gene = None, significance1 = None, significance
     args['original_terms'] = request.args.get('original_terms')
 
     if not significance1:
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-gene--gene.html',
             gene_info=gene_info,
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
                     min_conflict_level=min_conflict_level,
@@ -750,25 +718,17 @@ def variants_in_conflict_by_significance(significance1 = None, significance2 = N
         abort(404)
 
     if not significance2:
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-significance.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
+            total_variants_in_conflict=get_conflict_total(totals, 'in_conflict'),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
                     min_conflict_level=min_conflict_level,
@@ -812,42 +772,23 @@ def variants_in_conflict_by_submitter(submitter1_id = None, submitter2_id = None
 
     if submitter1_id == None:
         args['submitter1_id'] = list_arg('submitters')
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-submitter.html',
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-            summary=get_conflict_summary_by_submitter(
-                DB().total_variants_by_submitter(
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_submitter_and_conflict_level(
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
+            total_variants_in_conflict=get_conflict_total(totals, 'in_conflict'),
+            summary=get_conflict_summary(
+                DB().total_variants_by_submitter_and_conflict_threshold(
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                'submitter_id',
             ),
         )
 
@@ -858,44 +799,25 @@ def variants_in_conflict_by_submitter(submitter1_id = None, submitter2_id = None
     args['original_terms'] = request.args.get('original_terms')
 
     if submitter2_id == None:
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-submitter--1submitter.html',
             submitter1_info=submitter1_info,
             submitter1_primary_method=DB().submitter_primary_method(submitter1_id, args['date']),
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
-            total_variants_in_conflict=DB().total_variants(
-                min_conflict_level=min_conflict_level,
-                **args
-            ),
-            summary=get_conflict_summary_by_submitter(
-                DB().total_variants_by_submitter(
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=0,
-                    **args
-                ),
-                DB().total_variants_by_submitter(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-                DB().total_variants_in_conflict_by_submitter_and_conflict_level(
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
+            total_variants_in_conflict=get_conflict_total(totals, 'in_conflict'),
+            summary=get_conflict_summary(
+                DB().total_variants_by_submitter_and_conflict_threshold(
                     min_conflict_level=min_conflict_level,
                     **args
                 ),
+                'submitter_id',
             ),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
@@ -918,24 +840,18 @@ def variants_in_conflict_by_submitter(submitter1_id = None, submitter2_id = None
     args['submitter2_id'] = submitter2_id
 
     if not significance1:
+        totals = DB().total_variants_by_conflict_threshold(
+            min_conflict_level=min_conflict_level,
+            **args
+        )
         return render_template_async(
             'variants-in-conflict-by-submitter--2submitters.html',
             submitter1_info=submitter1_info,
             submitter2_info=submitter2_info,
             min_conflict_level=min_conflict_level,
-            overview=get_conflict_overview(
-                DB().total_variants_in_conflict_by_conflict_level(
-                    min_conflict_level=min_conflict_level,
-                    **args
-                ),
-            ),
-            total_variants=DB().total_variants(
-                **args
-            ),
-            total_variants_potentially_in_conflict=DB().total_variants(
-                min_conflict_level=0,
-                **args
-            ),
+            overview=get_conflict_overview(totals),
+            total_variants=get_conflict_total(totals, 'total'),
+            total_variants_potentially_in_conflict=get_conflict_total(totals, 'potentially_in_conflict'),
             breakdown=get_conflict_breakdown(
                 DB().total_variants_in_conflict_by_significance_and_significance(
                     min_conflict_level=min_conflict_level,
@@ -1,54 +1,101 @@
 #!/usr/bin/env python3
 
+import json
 import sqlite3
+from concurrent.futures import Future
+from db import DB, summary_methods
 
 
 print('Creating indexes')
 
-db = __import__('import-clinvar-xml').connect()
+importer = __import__('import-clinvar-xml')
+
+def create_indexes(cursor, temporal):
+    #in temporal storage, the facts are views over tables of date ranges, which get the indexes instead
+    submissions = 'submission_ranges' if temporal else 'submission_facts'
+    comparisons = 'comparison_ranges' if temporal else 'comparison_facts'
+
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS variants__name ON variants (name)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS genes__name ON genes (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submitters__name ON submitters (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submitters__country_code ON submitters (country_code)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS conditions__name ON conditions (name)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS significances__name ON significances (name)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS methods__name ON methods (name)')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__rsid ON ' + submissions + ' (rsid)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__gene ON ' + submissions + ' (gene_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__normalized_gene ON ' + submissions + ' (normalized_gene_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__rcv ON ' + submissions + ' (rcv)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__scv ON ' + submissions + ' (scv)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__submitter_id ON ' + submissions + ' (submitter_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__submitter ON ' + submissions + ' (submitter_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__significance ON ' + submissions + ' (significance_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__condition ON ' + submissions + ' (condition_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__condition_xrefs ON ' + submissions + ' (condition_xrefs)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__method ON ' + submissions + ' (method_key)')
+    if temporal:
+        cursor.execute('CREATE INDEX IF NOT EXISTS submissions__variant ON ' + submissions + ' (variant_key)')
+
+    if not temporal:
+        cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__date ON comparison_facts (date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__variant ON ' + comparisons + ' (variant_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__gene ON ' + comparisons + ' (gene_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__gene_type ON ' + comparisons + ' (gene_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_gene ON ' + comparisons + ' (normalized_gene_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_gene_type ON ' + comparisons + ' (normalized_gene_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter1_id ON ' + comparisons + ' (submitter1_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter1 ON ' + comparisons + ' (submitter1_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__scv1 ON ' + comparisons + ' (scv1)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__significance1 ON ' + comparisons + ' (significance1_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_significance1 ON ' + comparisons + ' (normalized_significance1_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__star_level1 ON ' + comparisons + ' (star_level1)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__condition1 ON ' + comparisons + ' (condition1_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__method1 ON ' + comparisons + ' (method1_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_method1 ON ' + comparisons + ' (normalized_method1_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter2_id ON ' + comparisons + ' (submitter2_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__significance2 ON ' + comparisons + ' (significance2_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_significance2 ON ' + comparisons + ' (normalized_significance2_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__star_level2 ON ' + comparisons + ' (star_level2)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_method2 ON ' + comparisons + ' (normalized_method2_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__condition2 ON ' + comparisons + ' (condition2_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__conflict_level ON ' + comparisons + ' (conflict_level)')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS variant_conflicts__gene ON variant_conflict_facts (gene_key)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS variant_conflicts__normalized_gene ON variant_conflict_facts (normalized_gene_key)'
+    )
+
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS significance_histograms__variant ON significance_histograms (date, variant_key)'
+    )
+    cursor.execute('CREATE INDEX IF NOT EXISTS significance_histograms__gene ON significance_histograms (gene_key)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS significance_histograms__normalized_gene ON significance_histograms (normalized_gene_key)'
+    )
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS mondo_clinvar_relationships__mondo_id ON mondo_clinvar_relationships (mondo_id)')
+
+if importer.is_partitioned():
+    #the website only reads the partitions, and the latest one gets the gene links
+    catalog = importer.connect(importer.catalog_filename)
+    filenames = list(map(lambda row: row[0], catalog.execute('SELECT filename FROM partitions ORDER BY date')))
+    for filename in filenames[0:-1]:
+        db = importer.connect(filename)
+        create_indexes(db.cursor(), False)
+        db.commit()
+        db.close()
+    db = importer.connect(filenames[-1])
+    temporal = False
+else:
+    db = importer.connect()
+    temporal = importer.is_temporal(db)
+
 cursor = db.cursor()
+create_indexes(cursor, temporal)
+
 
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__rsid ON submissions (rsid)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__gene ON submissions (gene)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__normalized_gene ON submissions (normalized_gene)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__rcv ON submissions (rcv)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__scv ON submissions (scv)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__submitter_id ON submissions (submitter_id)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__submitter_name ON submissions (submitter_name)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__submitter_country_code ON submissions (submitter_country_code)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__significance ON submissions (significance)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__condition_name ON submissions (condition_name)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__condition_xrefs ON submissions (condition_xrefs)')
-cursor.execute('CREATE INDEX IF NOT EXISTS submissions__method ON submissions (method)')
-
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__date ON comparisons (date)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__variant_name ON comparisons (variant_name)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__gene ON comparisons (gene)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__gene_type ON comparisons (gene_type)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_gene ON comparisons (normalized_gene)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_gene_type ON comparisons (normalized_gene_type)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter1_id ON comparisons (submitter1_id)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter1_name ON comparisons (submitter1_name)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter1_country_code ON comparisons (submitter1_country_code)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__scv1 ON comparisons(scv1)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__significance1 ON comparisons (significance1)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_significance1 ON comparisons (normalized_significance1)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__star_level1 ON comparisons (star_level1)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__condition1_name ON comparisons (condition1_name)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__method1 ON comparisons (method1)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_method1 ON comparisons (normalized_method1)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__submitter2_id ON comparisons (submitter2_id)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__significance2 ON comparisons (significance2)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_significance2 ON comparisons (normalized_significance2)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__star_level2 ON comparisons (star_level2)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__normalized_method2 ON comparisons (normalized_method2)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__condition2_name ON comparisons (condition2_name)')
-cursor.execute('CREATE INDEX IF NOT EXISTS comparisons__conflict_level ON comparisons (conflict_level)')
-
-cursor.execute('CREATE INDEX IF NOT EXISTS mondo_clinvar_relationships__mondo_id ON mondo_clinvar_relationships (mondo_id)')
-
-
-date = list(cursor.execute('SELECT MAX(date) FROM submissions'))[0][0]
+date = list(cursor.execute('SELECT MAX(date) FROM ' + ('dates' if temporal else 'submission_facts')))[0][0]
 
 
 print('Creating gene links table')
@@ -70,7 +117,7 @@ def create_gene_links_table(normalized):
     query = 'SELECT DISTINCT ' + gene_column + ' FROM submissions WHERE ' + type_column + '=2 AND date=?'
     gene_combinations = list(map(lambda row: row[0], cursor.execute(query, [date])))
 
-    query = 'SELECT 1 FROM submissions WHERE ' + gene_column + '=? AND date=?'
+    query = 'SELECT 1 FROM submission_facts WHERE ' + gene_column + '_key=(SELECT id FROM genes WHERE name=?) AND date=?'
     for gene_combination in gene_combinations:
         for individual_gene in gene_combination.split(', '):
             is_gene = bool(list(cursor.execute(query, [individual_gene, date])))
@@ -87,3 +134,38 @@ create_gene_links_table(False)
 
 db.commit()
 db.close()
+
+
+print('Creating summaries table')
+
+#the listing pages with their default filters are read from the summaries instead of being counted on every request
+summaries = importer.connect(importer.catalog_filename if importer.is_partitioned() else 'clinvar.db')
+summarized_dates = set(map(lambda row: row[0], summaries.execute('SELECT DISTINCT date FROM summaries')))
+
+for date in DB().dates():
+    if date in summarized_dates:
+        continue
+    rows = []
+    for method in summary_methods:
+        for original_genes in [False, True]:
+            for original_terms in [False, True]:
+                result = getattr(DB(), method)(
+                    min_stars=0,
+                    min_stars1=0,
+                    min_stars2=0,
+                    min_conflict_level=-1,
+                    gene_type=-1,
+                    original_genes=original_genes,
+                    original_terms=original_terms,
+                    date=date,
+                )
+                if isinstance(result, Future):
+                    result = result.result()
+                rows.append([date, method, 0, '', -1, -1, original_genes, original_terms, json.dumps(result)])
+    summaries.executemany('INSERT OR REPLACE INTO summaries VALUES (?,?,?,?,?,?,?,?,?)', rows)
+    summaries.commit()
+
+summaries.close()
+
+#the gene links are new, so the website's cached pages are out of date
+importer.update_generation()
@@ -1,30 +1,437 @@
+import json
 import sqlite3
 from asynchelper import promise
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+from os import environ, stat
+from os.path import exists
 from sqlite3 import OperationalError
+from threading import Condition, Lock, local
+from time import monotonic
+from weakref import WeakSet
+
+#text columns that are stored as keys into dimension tables, and the tables that the keys refer to
+dimension_columns = {
+    'variant_name': ('variant_key', 'variants'),
+    'gene': ('gene_key', 'genes'),
+    'normalized_gene': ('normalized_gene_key', 'genes'),
+    'condition_name': ('condition_key', 'conditions'),
+    'condition1_name': ('condition1_key', 'conditions'),
+    'condition2_name': ('condition2_key', 'conditions'),
+    'significance': ('significance_key', 'significances'),
+    'normalized_significance': ('normalized_significance_key', 'significances'),
+    'significance1': ('significance1_key', 'significances'),
+    'normalized_significance1': ('normalized_significance1_key', 'significances'),
+    'significance2': ('significance2_key', 'significances'),
+    'normalized_significance2': ('normalized_significance2_key', 'significances'),
+    'method': ('method_key', 'methods'),
+    'normalized_method': ('normalized_method_key', 'methods'),
+    'method1': ('method1_key', 'methods'),
+    'normalized_method1': ('normalized_method1_key', 'methods'),
+    'normalized_method2': ('normalized_method2_key', 'methods'),
+}
+
+#filters that the listing pages can use without losing their summaries
+summary_filters = {
+    'date', 'min_stars', 'min_stars1', 'min_stars2', 'normalized_method', 'normalized_method1', 'normalized_method2',
+    'min_conflict_level', 'gene_type', 'original_genes', 'original_terms',
+}
+
+#filters that only depend on a variant and on the stars, methods and conflict level of its comparisons
+variant_conflict_filters = {
+    'date', 'min_stars1', 'min_stars2', 'min_conflict_level', 'normalized_method1', 'normalized_method2', 'gene',
+    'gene_type', 'original_genes', 'original_terms',
+}
+
+#methods whose results create-indexes.py stores in the summaries table
+summary_methods = []
+
+def summarized(fn):
+    summary_methods.append(fn.__name__)
+    @wraps(fn)
+    def wrapper(self, **kwargs):
+        summary = self.summary(fn.__name__, kwargs)
+        return fn(self, **kwargs) if summary == None else summary
+    return wrapper
+
+#settings for every pooled connection, negative cache sizes are in KiB
+cache_size = int(environ.get('DB_CACHE_SIZE', -16384))
+mmap_size = int(environ.get('DB_MMAP_SIZE', 268435456))
+
+class Connection(sqlite3.Connection):
+    #the date whose file is attached as the partition schema, which stays attached when the connection is reused, and
+    #the catalog as it was then, because importing a date again replaces its file under the same name
+    partition_date = None
+    partition_catalog = None
+
+class ConnectionPool():
+    #long-lived read connections that the DB objects of every request and thread take turns with, so that each query
+    #doesn't start with a new connection and an empty page cache
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.condition = Condition()
+        self.idle = {}
+        self.open = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0
+        self.overflows = 0
+
+    def has_room(self, filename):
+        #called with the condition held, connections to a file that the website has stopped using, such as clinvar.db
+        #after switching to partitions, are closed to make room instead of being waited for
+        if self.idle.get(filename) or self.open < self.size:
+            return True
+        for connections in self.idle.values():
+            if connections:
+                connections.pop().close()
+                self.open -= 1
+                return True
+        return False
+
+    def get(self, filename):
+        with self.condition:
+            self.checkouts += 1
+            if not self.has_room(filename):
+                #wait for a connection to come back, but rather open an extra one than wait forever
+                self.waits += 1
+                start = monotonic()
+                self.condition.wait_for(lambda: self.has_room(filename), self.timeout)
+                self.wait_time += monotonic() - start
+            if self.idle.get(filename):
+                return self.idle[filename].pop()
+            if self.open >= self.size:
+                self.overflows += 1
+            self.open += 1
+
+        connection = sqlite3.connect(
+            filename, timeout=20, check_same_thread=False, factory=Connection, cached_statements=256
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA cache_size=' + str(cache_size))
+        connection.execute('PRAGMA mmap_size=' + str(mmap_size))
+        connection.execute('PRAGMA temp_store=MEMORY')
+        connection.filename = filename
+        return connection
+
+    def put(self, connection):
+        #end any transaction that the connection was left in so that it doesn't hold a read lock
+        connection.rollback()
+        with self.condition:
+            if self.open > self.size:
+                self.open -= 1
+                connection.close()
+            else:
+                self.idle.setdefault(connection.filename, []).append(connection)
+                self.condition.notify()
+
+    def statistics(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'open': self.open,
+                'idle': sum(map(len, self.idle.values())),
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'overflows': self.overflows,
+            }
+
+pool = ConnectionPool(int(environ.get('DB_POOL_SIZE', 8)), float(environ.get('DB_POOL_TIMEOUT', 20)))
+
+#values that only change when the database file does, for the file as it was when they were read
+metadata_cache = {}
+
+class ResultCache():
+    #results of the counting queries, stored as JSON so that every caller gets its own copy, and evicted least recently
+    #used first once their total length goes over the size
+    def __init__(self, size):
+        self.size = size
+        self.lock = Lock()
+        self.file_identity = None
+        self.results = OrderedDict()
+        self.bytes = 0
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, file_identity, key, load):
+        result = None
+        loading = None
+        with self.lock:
+            if file_identity != self.file_identity:
+                self.file_identity = file_identity
+                self.results.clear()
+                self.bytes = 0
+            if key in self.results:
+                self.hits += 1
+                self.results.move_to_end(key)
+                result = self.results[key]
+            elif key in self.in_flight:
+                #wait for the same query from another request instead of running it twice
+                self.coalesced += 1
+                loading = self.in_flight[key]
+            else:
+                self.misses += 1
+                self.in_flight[key] = Future()
+
+        if result != None:
+            return json.loads(result)
+        if loading:
+            return json.loads(loading.result())
+
+        try:
+            result = json.dumps(load())
+        except Exception as e:
+            with self.lock:
+                self.in_flight.pop(key).set_exception(e)
+            raise
+
+        with self.lock:
+            self.in_flight.pop(key).set_result(result)
+            if file_identity == self.file_identity and key not in self.results and len(result) <= self.size:
+                self.results[key] = result
+                self.bytes += len(result)
+                while self.bytes > self.size:
+                    self.bytes -= len(self.results.popitem(last=False)[1])
+                    self.evictions += 1
+        return json.loads(result)
+
+    def statistics(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'bytes': self.bytes,
+                'results': len(self.results),
+                'in_flight': len(self.in_flight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+            }
+
+result_cache = ResultCache(int(environ.get('RESULT_CACHE_SIZE', 67108864)))
+
+def memoized(fn):
+    #the key has the date that the query resolves to so that a new latest date doesn't get the old date's results
+    @wraps(fn)
+    def wrapper(self, **kwargs):
+        key = (fn.__name__, json.dumps(kwargs, sort_keys=True), kwargs.get('date') or self.max_date())
+        return result_cache.get(self.file_identity, key, lambda: fn(self, **kwargs))
+    return wrapper
+
+def promise_query(fn):
+    #each promised query gets its own DB object, and with it its own connection, cursor and query, so that promises made
+    #on the same DB object don't overwrite each other's query or share a cursor from different threads, and the
+    #connection goes back to the pool even if the query fails, because the future keeps the exception and with it the DB
+    def run(*args, **kwargs):
+        db = DB()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+    submit = promise(run)
+    return lambda self, *args, **kwargs: submit(*args, **kwargs)
+
+#the DB objects of each thread that haven't been closed yet, which don't keep them from being garbage-collected
+open_dbs = local()
+
+def close_dbs():
+    #return the connections of a request's DB objects that something, such as an exception's traceback, still refers to
+    for db in list(getattr(open_dbs, 'dbs', [])):
+        db.close()
 
 class DB():
     def __init__(self):
-        self.db = sqlite3.connect('clinvar.db', timeout=20, check_same_thread=False)
-        self.db.row_factory = sqlite3.Row
+        #in partitioned storage, each date is in its own file and the catalog lists them
+        self.partitioned = exists('clinvar-partitions.db')
+        filename = 'clinvar-partitions.db' if self.partitioned else 'clinvar.db'
+        self.db = pool.get(filename)
         self.cursor = self.db.cursor()
+        if not hasattr(open_dbs, 'dbs'):
+            open_dbs.dbs = WeakSet()
+        open_dbs.dbs.add(self)
+        #importing a date replaces or modifies the file, which starts a new cache
+        file_stat = stat(filename)
+        self.file_identity = (filename, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+        #in temporal storage, submissions and comparisons are views over tables of date ranges
+        self.temporal = self.metadata('temporal', lambda: bool(list(self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name='submission_ranges'"
+        ))))
+        self.submissions_table = 'submission_ranges' if self.temporal else 'submission_facts'
+        if self.partitioned:
+            self.dates_table = 'partitions'
+        elif self.temporal:
+            self.dates_table = 'dates'
+        else:
+            self.dates_table = 'submission_facts'
+
+    def close(self):
+        #the connection is only put back once, whether by close or when the object is garbage-collected
+        db = self.__dict__.pop('db', None)
+        if db:
+            self.cursor.close()
+            pool.put(db)
+
+    def __del__(self):
+        self.close()
+
+    def metadata(self, name, load):
+        cache = metadata_cache.get(self.file_identity)
+        if cache == None:
+            metadata_cache.clear()
+            cache = metadata_cache.setdefault(self.file_identity, {})
+        if name not in cache:
+            cache[name] = load()
+        return cache[name]
+
+    def names(self, table, column, keys):
+        #the names in a dimension table that any submission on any date refers to, checked through the index on the key
+        return self.metadata(table + '.' + column, lambda: set(map(
+            lambda row: row[0],
+            self.fan_out(
+                'SELECT ' + column + ' FROM ' + table + ' WHERE ' + ' OR '.join(map(
+                    lambda key: 'EXISTS (SELECT 1 FROM ' + self.submissions_table + ' WHERE ' + key + '=' + table + '.id)',
+                    keys
+                ))
+            )
+        )))
+
+    def partition(self, date):
+        #attach the date's file so that its tables can be queried as if they were in the main database
+        date = date or self.max_date()
+        if self.partitioned and (date != self.db.partition_date or self.file_identity != self.db.partition_catalog):
+            rows = list(self.cursor.execute('SELECT filename FROM partitions WHERE date=?', [date]))
+            if rows:
+                if self.db.partition_date:
+                    self.cursor.execute('DETACH partition')
+                self.cursor.execute('ATTACH ? AS partition', [rows[0][0]])
+                self.cursor.execute('PRAGMA partition.cache_size=' + str(cache_size))
+                self.cursor.execute('PRAGMA partition.mmap_size=' + str(mmap_size))
+                self.db.partition_date = date
+                self.db.partition_catalog = self.file_identity
+        return date
+
+    def fan_out(self, query, parameters = [], max_date = None):
+        #run a query that isn't limited to one date on every partition, oldest first
+        if not self.partitioned:
+            yield from self.cursor.execute(query, parameters)
+            return
+        for date in reversed(self.dates()):
+            if max_date and date > max_date:
+                break
+            self.partition(date)
+            yield from list(self.cursor.execute(query, parameters))
 
     def and_equals(self, column, value):
         if type(value) == list:
             if not value:
                 return
-            db_types = {
-                int: 'INTEGER',
-                str: 'TEXT',
-            }
-            self.cursor.execute('DROP TABLE IF EXISTS ' + column) #the same connection may perform multiple queries
-            self.cursor.execute('CREATE TEMP TABLE ' + column + ' (value ' + db_types[type(value[0])] + ')')
-            self.cursor.execute('CREATE INDEX ' + column + '__value ON ' + column + ' (value)')
-            self.cursor.executemany('INSERT INTO ' + column + ' VALUES (?)', map(lambda value: [value], value))
-            self.query += ' AND ' + column + ' IN (SELECT value FROM ' + column + ')'
+            #the list is bound as one JSON array so that the query text is the same whatever the values are, and SQLite
+            #can reuse the prepared statement
+            if column in dimension_columns:
+                #look up the keys of the values once instead of looking up the value of every row
+                key, table = dimension_columns[column]
+                self.query += (
+                    ' AND ' + key + ' IN (SELECT id FROM ' + table + ' WHERE name IN (SELECT value FROM json_each(:' +
+                    column + ')))'
+                )
+            else:
+                self.query += ' AND ' + column + ' IN (SELECT value FROM json_each(:' + column + '))'
+            self.parameters[column] = json.dumps(value)
         else:
-            self.query += ' AND ' + column + '=:' + column
+            if column in dimension_columns:
+                key, table = dimension_columns[column]
+                self.query += ' AND ' + key + '=(SELECT id FROM ' + table + ' WHERE name=:' + column + ')'
+            else:
+                self.query += ' AND ' + column + '=:' + column
             self.parameters[column] = value
 
+    def summary(self, method, kwargs):
+        #the summaries only cover the same stars and method for both submissions in a comparison and no other filters
+        min_stars = set(map(
+            lambda name: max(0, kwargs[name]), filter(lambda name: name in kwargs, ['min_stars', 'min_stars1', 'min_stars2'])
+        ))
+        methods = set(map(
+            lambda name: kwargs[name] or '',
+            filter(lambda name: name in kwargs, ['normalized_method', 'normalized_method1', 'normalized_method2'])
+        ))
+        if len(min_stars) > 1 or len(methods) > 1:
+            return None
+        for name in kwargs:
+            if name not in summary_filters and kwargs[name] != None:
+                return None
+
+        rows = list(self.cursor.execute(
+            '''
+                SELECT result FROM summaries
+                WHERE
+                    date=? AND
+                    method=? AND
+                    min_stars=? AND
+                    normalized_method=? AND
+                    min_conflict_level=? AND
+                    gene_type=? AND
+                    original_genes=? AND
+                    original_terms=?
+            ''',
+            [
+                self.partition(kwargs.get('date')),
+                method,
+                min_stars.pop() if min_stars else 0,
+                methods.pop() if methods else '',
+                kwargs.get('min_conflict_level', -1),
+                kwargs.get('gene_type', -1),
+                bool(kwargs.get('original_genes')),
+                bool(kwargs.get('original_terms')),
+            ]
+        ))
+        return json.loads(rows[0][0]) if rows else None
+
+    def comparisons_table(self, kwargs):
+        #every submission is compared with itself at conflict level -1, so if a query doesn't ask for conflicts and its
+        #filters on the second submission are already met by the first, that comparison alone answers it
+        if (
+            kwargs.get('min_conflict_level', -1) <= -1 and
+            max(0, kwargs.get('min_stars2', 0)) <= max(0, kwargs.get('min_stars1', 0)) and
+            kwargs.get('normalized_method2') in [None, '', kwargs.get('normalized_method1')] and
+            not kwargs.get('submitter2_id') and
+            not kwargs.get('significance2')
+        ):
+            return 'submission_comparisons'
+        return 'comparisons'
+
+    def variant_comparisons_table(self, kwargs, by_conflict_level = False):
+        if not by_conflict_level and self.comparisons_table(kwargs) == 'submission_comparisons':
+            return 'submission_comparisons'
+        #counts of variants or genes that only use the variant's filters can read the distinct combinations of them for
+        #each variant instead of every comparison
+        return 'variant_conflicts' if self.is_variant_query(kwargs) else 'comparisons'
+
+    def conflict_threshold_columns(self):
+        #the counts for every threshold that the conflict pages show, taken in the same pass over the comparisons
+        columns = '''
+            COUNT(DISTINCT variant_key) AS total,
+            COUNT(DISTINCT CASE WHEN conflict_level>=0 THEN variant_key END) AS potentially_in_conflict,
+            COUNT(DISTINCT CASE WHEN conflict_level>=:min_conflict_level THEN variant_key END) AS in_conflict
+        '''
+        for level in range(1, 6):
+            columns += (
+                ', COUNT(DISTINCT CASE WHEN conflict_level=' + str(level) +
+                ' AND conflict_level>=:min_conflict_level THEN variant_key END) AS level' + str(level)
+            )
+        return columns
+
+    def is_variant_query(self, kwargs):
+        for name in kwargs:
+            if name not in variant_conflict_filters and kwargs[name]:
+                return False
+        return True
+
     def rows(self):
         return list(map(dict, self.cursor.execute(self.query, self.parameters)))
 
@@ -35,7 +442,7 @@ class DB():
         try:
             self.cursor.execute(
                 'SELECT clinvar_name FROM mondo_clinvar_relationships WHERE mondo_id=? AND date=?',
-                [mondo_id, date or self.max_date()]
+                [mondo_id, self.partition(date)]
             )
             return [row[0] for row in self.cursor.fetchall()]
         except IndexError:
@@ -45,10 +452,11 @@ class DB():
         try:
             return list(self.cursor.execute(
                 '''
-                    SELECT DISTINCT condition_xrefs FROM submissions WHERE condition_name=? AND date=?
+                    SELECT DISTINCT condition_xrefs FROM submissions
+                    WHERE condition_key=(SELECT id FROM conditions WHERE name=?) AND date=?
                     ORDER BY condition_xrefs=='' /* prefer a row that has cross-references */ LIMIT 1
                 ''',
-                [condition_name, date or self.max_date()]
+                [condition_name, self.partition(date)]
             ))[0][0].split(';')
         except IndexError:
             return []
@@ -56,23 +464,35 @@ class DB():
     def country_name(self, country_code, date = None):
         try:
             return list(self.cursor.execute(
-                'SELECT submitter_country_name FROM submissions WHERE submitter_country_code=? AND date=? LIMIT 1',
-                [country_code, date or self.max_date()]
+                '''
+                    SELECT submitter_country_name FROM submissions
+                    WHERE submitter_key IN (SELECT id FROM submitters WHERE country_code=?) AND date=? LIMIT 1
+                ''',
+                [country_code, self.partition(date)]
             ))[0][0]
         except IndexError:
             return None
 
     def dates(self):
-        return list(map(
+        return list(self.metadata('dates', lambda: list(map(
             lambda row: row[0],
-            self.cursor.execute('SELECT DISTINCT date FROM submissions ORDER BY date DESC')
-        ))
+            self.cursor.execute('SELECT DISTINCT date FROM ' + self.dates_table + ' ORDER BY date DESC')
+        ))))
+
+    def generation(self):
+        #the importer gives the database a new generation whenever it changes what the pages show
+        def load():
+            try:
+                return list(self.cursor.execute('SELECT id FROM generation'))[0][0]
+            except (OperationalError, IndexError):
+                return None
+        return self.metadata('generation', load)
 
     def gene_from_rsid(self, rsid, date = None):
         try:
             return list(self.cursor.execute(
                 'SELECT DISTINCT gene FROM submissions WHERE rsid=? AND date=? LIMIT 1',
-                [rsid, date or self.max_date()]
+                [rsid, self.partition(date)]
             ))[0][0]
         except IndexError:
             return None
@@ -80,10 +500,16 @@ class DB():
     def gene_info(self, gene, original_genes, date = None):
         try:
             if original_genes:
-                query = 'SELECT gene_type FROM submissions WHERE gene=? AND date=? LIMIT 1'
+                query = '''
+                    SELECT gene_type FROM submission_facts
+                    WHERE gene_key=(SELECT id FROM genes WHERE name=?) AND date=? LIMIT 1
+                '''
             else:
-                query = 'SELECT normalized_gene_type FROM submissions WHERE normalized_gene=? AND date=? LIMIT 1'
-            ret = {'name': gene, 'type': list(self.cursor.execute(query, [gene, date or self.max_date()]))[0][0]}
+                query = '''
+                    SELECT normalized_gene_type FROM submission_facts
+                    WHERE normalized_gene_key=(SELECT id FROM genes WHERE name=?) AND date=? LIMIT 1
+                '''
+            ret = {'name': gene, 'type': list(self.cursor.execute(query, [gene, self.partition(date)]))[0][0]}
         except IndexError:
             ret = {'name': gene, 'type': 0}
 
@@ -99,59 +525,68 @@ class DB():
         return ret
 
     def is_date(self, date):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE date=? LIMIT 1',
-            [date]
-        )))
+        return date in self.metadata('date_set', lambda: set(self.dates()))
 
     def is_gene(self, gene):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE gene=? OR normalized_gene=? LIMIT 1',
-            [gene, gene]
-        )))
+        return gene in self.names('genes', 'name', ['gene_key', 'normalized_gene_key'])
 
     def is_condition_name(self, condition_name):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE condition_name=? LIMIT 1',
-            [condition_name]
-        )))
+        return condition_name in self.names('conditions', 'name', ['condition_key'])
 
     def is_mondo_condition_id(self, mondo_condition_id):
-        return bool(list(self.cursor.execute(
+        return any(self.fan_out(
             'SELECT 1 FROM mondo_clinvar_relationships WHERE mondo_id=? LIMIT 1',
             [mondo_condition_id]
-        )))
+        ))
 
     def is_significance(self, significance):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE significance=? LIMIT 1',
-            [significance]
-        )))
+        return significance in self.names('significances', 'name', ['significance_key'])
 
     def is_submitter_id(self, submitter_id):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE submitter_id=? LIMIT 1',
-            [submitter_id]
-        )))
+        return submitter_id in self.names('submitters', 'submitter_id', ['submitter_key'])
 
     def is_variant_name(self, variant_name):
-        return bool(list(self.cursor.execute(
-            'SELECT 1 FROM submissions WHERE variant_name=? LIMIT 1',
+        return any(self.fan_out(
+            'SELECT 1 FROM submission_facts WHERE variant_key=(SELECT id FROM variants WHERE name=?) LIMIT 1',
             [variant_name]
-        )))
+        ))
 
     def max_date(self):
-        return list(self.cursor.execute('SELECT MAX(date) FROM submissions'))[0][0]
+        dates = self.dates()
+        return dates[0] if dates else None
 
     def significance_term_info(self):
-        return list(map(
-            dict,
-            self.cursor.execute('''
-                SELECT significance, MIN(date) AS first_seen, MAX(date) AS last_seen FROM submissions
-                GROUP BY significance ORDER BY last_seen DESC, first_seen DESC
-            ''')
-        ))
+        if self.temporal:
+            query = '''
+                SELECT
+                    (SELECT name FROM significances WHERE id=significance_key) AS significance,
+                    MIN(first_date) AS first_seen,
+                    MAX(last_date) AS last_seen
+                FROM submission_ranges
+                GROUP BY significance_key ORDER BY last_seen DESC, first_seen DESC
+            '''
+        else:
+            query = '''
+                SELECT
+                    (SELECT name FROM significances WHERE id=significance_key) AS significance,
+                    MIN(date) AS first_seen,
+                    MAX(date) AS last_seen
+                FROM submission_facts
+                GROUP BY significance_key ORDER BY last_seen DESC, first_seen DESC
+            '''
+
+        if not self.partitioned:
+            return list(map(dict, self.cursor.execute(query)))
 
+        terms = {}
+        for row in self.fan_out(query):
+            if row['significance'] in terms:
+                terms[row['significance']]['last_seen'] = row['last_seen']
+            else:
+                terms[row['significance']] = dict(row)
+        return sorted(terms.values(), key=lambda term: (term['last_seen'], term['first_seen']), reverse=True)
+
+    @memoized
     def submissions(self, **kwargs):
         self.query = '''
             SELECT
@@ -177,7 +612,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('variant_name'):
@@ -194,8 +629,11 @@ class DB():
     def submitter_id_from_name(self, submitter_name, date = None):
         try:
             return list(self.cursor.execute(
-                'SELECT submitter_id FROM submissions WHERE submitter_name=? AND date=? LIMIT 1',
-                [submitter_name, date or self.max_date()]
+                '''
+                    SELECT submitter_id FROM submission_facts
+                    WHERE submitter_key IN (SELECT id FROM submitters WHERE name=?) AND date=? LIMIT 1
+                ''',
+                [submitter_name, self.partition(date)]
             ))[0][0]
         except IndexError:
             return None
@@ -207,7 +645,7 @@ class DB():
                     SELECT submitter_name, submitter_country_name
                     FROM submissions WHERE submitter_id=? AND date=? LIMIT 1
                 ''',
-                [submitter_id, date or self.max_date()]
+                [submitter_id, self.partition(date)]
             ))[0]
             return {'id': submitter_id, 'name': row[0], 'country_name': row[1]}
         except IndexError:
@@ -218,15 +656,17 @@ class DB():
             return list(
                 self.cursor.execute('''
                     SELECT method FROM submissions WHERE submitter_id=? AND date=?
-                    GROUP BY method ORDER BY COUNT(*) DESC LIMIT 1
-                ''', [submitter_id, date or self.max_date()])
+                    GROUP BY method_key ORDER BY COUNT(*) DESC LIMIT 1
+                ''', [submitter_id, self.partition(date)])
             )[0][0]
         except IndexError:
             return 'not provided'
 
+    @memoized
+    @summarized
     def total_conditions(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT condition1_name) FROM comparisons
+            SELECT COUNT(DISTINCT condition1_key) FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -238,7 +678,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene'):
@@ -264,11 +704,13 @@ class DB():
 
         return self.value()
 
+    @memoized
+    @summarized
     def total_genes(self, **kwargs):
         if kwargs.get('original_genes'):
-            self.query = 'SELECT COUNT(DISTINCT gene) FROM comparisons'
+            self.query = 'SELECT COUNT(DISTINCT gene_key) FROM ' + self.variant_comparisons_table(kwargs)
         else:
-            self.query = 'SELECT COUNT(DISTINCT normalized_gene) FROM comparisons'
+            self.query = 'SELECT COUNT(DISTINCT normalized_gene_key) FROM ' + self.variant_comparisons_table(kwargs)
 
         self.query += '''
             WHERE
@@ -282,7 +724,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('condition1_name'):
@@ -308,27 +750,29 @@ class DB():
     def mondo_conditions(self, date = None):
         return list(map(dict, self.cursor.execute(
             'SELECT DISTINCT mondo_id, mondo_name FROM mondo_clinvar_relationships WHERE date=? ORDER BY mondo_name',
-            [date or self.max_date()]
+            [self.partition(date)]
         )))
 
     def mondo_name(self, mondo_id, date = None):
         self.cursor.execute(
             'SELECT mondo_name FROM mondo_clinvar_relationships where mondo_id=? AND date=?',
-            [mondo_id, date or self.max_date()]
+            [mondo_id, self.partition(date)]
         )
         name = self.cursor.fetchone()[0]
         return name
 
-    @promise
+    @promise_query
     def total_significance_terms_over_time(self):
         return list(map(
             dict,
-            self.cursor.execute('SELECT date, COUNT(DISTINCT significance) AS count FROM submissions GROUP BY date')
+            self.fan_out('SELECT date, COUNT(DISTINCT significance_key) AS count FROM submission_facts GROUP BY date')
         ))
 
+    @memoized
+    @summarized
     def total_submissions(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT scv1) FROM comparisons
+            SELECT COUNT(DISTINCT scv1) FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars AND
                 star_level2>=:min_stars AND
@@ -339,7 +783,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('country_code'):
@@ -350,9 +794,11 @@ class DB():
 
         return self.value()
 
+    @memoized
+    @summarized
     def total_submitters(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT submitter1_id) FROM comparisons
+            SELECT COUNT(DISTINCT submitter1_id) FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -364,7 +810,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene'):
@@ -390,13 +836,15 @@ class DB():
 
         return self.value()
 
+    @memoized
+    @summarized
     def total_submissions_by_country(self, **kwargs):
         self.query = '''
             SELECT
                 submitter1_country_code AS country_code,
                 submitter1_country_name AS country_name,
                 COUNT(DISTINCT scv1) AS count
-            FROM comparisons
+            FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars AND
                 star_level2>=:min_stars AND
@@ -407,7 +855,7 @@ class DB():
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('normalized_method'):
@@ -418,57 +866,61 @@ class DB():
 
         return self.rows()
 
+    @memoized
     def total_submissions_by_method(self, **kwargs):
         return list(map(
             dict,
             self.cursor.execute(
                 '''
                     SELECT method1 AS method, COUNT(DISTINCT scv1) AS count
-                    FROM comparisons
+                    FROM ''' + self.comparisons_table(kwargs) + '''
                     WHERE star_level1>=:min_stars AND star_level2>=:min_stars AND conflict_level>=:min_conflict_level
-                    GROUP BY method ORDER BY count DESC
+                    GROUP BY method1_key ORDER BY count DESC
                 ''',
                 {
                     'min_stars': kwargs.get('min_stars', 0),
                     'min_conflict_level': kwargs.get('min_conflict_level', -1),
-                    'date': kwargs.get('date') or self.max_date(),
+                    'date': self.partition(kwargs.get('date')),
                 }
             )
         ))
 
+    @memoized
     def total_submissions_by_normalized_method_over_time(self, **kwargs):
         return list(map(
             dict,
-            self.cursor.execute(
+            self.fan_out(
                 '''
                     SELECT date, normalized_method1 AS normalized_method, COUNT(DISTINCT scv1) AS count
-                    FROM comparisons
+                    FROM ''' + self.comparisons_table(kwargs) + '''
                     WHERE
                         star_level1>=:min_stars AND
                         star_level2>=:min_stars AND
                         conflict_level>=:min_conflict_level AND
                         date<=:date
-                    GROUP BY date, normalized_method ORDER BY date, count DESC
+                    GROUP BY date, normalized_method1_key ORDER BY date, count DESC
                 ''',
                 {
                     'min_stars': kwargs.get('min_stars', 0),
                     'min_conflict_level': kwargs.get('min_conflict_level', -1),
-                    'date': kwargs.get('date') or self.max_date(),
-                }
+                    'date': self.partition(kwargs.get('date')),
+                },
+                kwargs.get('date') or self.max_date()
             )
         ))
 
+    @memoized
     def total_submissions_by_submitter(self, **kwargs):
         self.query = '''
             SELECT submitter1_id AS submitter_id, submitter1_name AS submitter_name, COUNT(DISTINCT scv1) AS count
-            FROM comparisons
+            FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE star_level1>=:min_stars AND conflict_level>=:min_conflict_level AND date=:date
         '''
 
         self.parameters = {
             'min_stars': kwargs.get('min_stars', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('country_code'):
@@ -481,9 +933,10 @@ class DB():
 
         return self.rows()
 
+    @memoized
+    @summarized
     def total_variants(self, **kwargs):
-        self.query = '''
-            SELECT COUNT(DISTINCT variant_name) FROM comparisons
+        self.query = 'SELECT COUNT(DISTINCT variant_key) FROM ' + self.variant_comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -495,7 +948,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -533,7 +986,9 @@ class DB():
 
         return self.value()
 
-    @promise
+    @promise_query
+    @memoized
+    @summarized
     def total_variants_by_condition(self, **kwargs):
         if type(kwargs.get('condition1_name')) is not str:
             self.query = 'SELECT condition1_name AS condition_name'
@@ -541,13 +996,13 @@ class DB():
             self.query = 'SELECT condition2_name AS condition_name'
 
         if kwargs.get('original_genes'):
-            self.query += ', COUNT(DISTINCT gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT gene_key) AS gene_count'
         else:
-            self.query += ', COUNT(DISTINCT normalized_gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT normalized_gene_key) AS gene_count'
 
         self.query += '''
             , COUNT(DISTINCT submitter1_id) AS submitter_count
-            , COUNT(DISTINCT variant_name) AS count
+            , COUNT(DISTINCT variant_key) AS count
             FROM comparisons
             WHERE
                 star_level1>=:min_stars1 AND
@@ -560,7 +1015,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -593,13 +1048,73 @@ class DB():
             else:
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
-        self.query += ' GROUP BY condition_name ORDER BY count DESC'
+        if type(kwargs.get('condition1_name')) is not str:
+            self.query += ' GROUP BY condition1_key ORDER BY count DESC'
+        else:
+            self.query += ' GROUP BY condition2_key ORDER BY count DESC'
+
+        return self.rows()
+
+    @promise_query
+    @memoized
+    def total_variants_by_condition_and_conflict_threshold(self, **kwargs):
+        if type(kwargs.get('condition1_name')) is not str:
+            self.query = 'SELECT condition1_name AS condition_name, '
+        else:
+            self.query = 'SELECT condition2_name AS condition_name, '
+
+        self.query += self.conflict_threshold_columns() + '''
+            FROM comparisons
+            WHERE
+                star_level1>=:min_stars1 AND
+                star_level2>=:min_stars2 AND
+                date=:date
+        '''
+
+        self.parameters = {
+            'min_stars1': kwargs.get('min_stars1', 0),
+            'min_stars2': kwargs.get('min_stars2', 0),
+            'min_conflict_level': kwargs.get('min_conflict_level', 1),
+            'date': self.partition(kwargs.get('date')),
+        }
+
+        if kwargs.get('gene') != None:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene', kwargs['gene'])
+            else:
+                self.and_equals('normalized_gene', kwargs['gene'])
+
+        if kwargs.get('condition1_name'):
+            self.and_equals('condition1_name', kwargs['condition1_name'])
+
+        if kwargs.get('submitter1_id'):
+            self.and_equals('submitter1_id', kwargs['submitter1_id'])
+
+        if kwargs.get('normalized_method1'):
+            self.and_equals('normalized_method1', kwargs['normalized_method1'])
+
+        if kwargs.get('normalized_method2'):
+            self.and_equals('normalized_method2', kwargs['normalized_method2'])
+
+        if kwargs.get('gene_type', -1) != -1:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene_type', kwargs['gene_type'])
+            else:
+                self.and_equals('normalized_gene_type', kwargs['gene_type'])
+
+        if type(kwargs.get('condition1_name')) is not str:
+            self.query += ' GROUP BY condition1_key'
+        else:
+            self.query += ' GROUP BY condition2_key'
+
+        self.query += ' HAVING in_conflict ORDER BY in_conflict DESC'
 
         return self.rows()
 
-    @promise
+    @promise_query
+    @memoized
     def total_variants_by_condition_and_significance(self, **kwargs):
-        self.query = 'SELECT condition1_name AS condition_name, COUNT(DISTINCT variant_name) AS count'
+        self.query = 'SELECT condition1_name AS condition_name, COUNT(DISTINCT variant_key) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
@@ -607,7 +1122,7 @@ class DB():
             self.query += ', normalized_significance1 AS significance'
 
         self.query += '''
-            FROM comparisons
+            FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -619,7 +1134,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -646,11 +1161,63 @@ class DB():
             else:
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
-        self.query += ' GROUP BY condition_name, significance'
+        if kwargs.get('original_terms'):
+            self.query += ' GROUP BY condition1_key, significance1_key'
+        else:
+            self.query += ' GROUP BY condition1_key, normalized_significance1_key'
 
         return self.rows()
 
-    @promise
+    @promise_query
+    @memoized
+    def total_variants_by_conflict_threshold(self, **kwargs):
+        self.query = 'SELECT ' + self.conflict_threshold_columns() + '''
+            FROM ''' + self.variant_comparisons_table(kwargs, True) + '''
+            WHERE
+                star_level1>=:min_stars1 AND
+                star_level2>=:min_stars2 AND
+                date=:date
+        '''
+
+        self.parameters = {
+            'min_stars1': kwargs.get('min_stars1', 0),
+            'min_stars2': kwargs.get('min_stars2', 0),
+            'min_conflict_level': kwargs.get('min_conflict_level', 1),
+            'date': self.partition(kwargs.get('date')),
+        }
+
+        if kwargs.get('gene') != None:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene', kwargs['gene'])
+            else:
+                self.and_equals('normalized_gene', kwargs['gene'])
+
+        if kwargs.get('condition1_name'):
+            self.and_equals('condition1_name', kwargs['condition1_name'])
+
+        if kwargs.get('submitter1_id'):
+            self.and_equals('submitter1_id', kwargs['submitter1_id'])
+
+        if kwargs.get('submitter2_id'):
+            self.and_equals('submitter2_id', kwargs['submitter2_id'])
+
+        if kwargs.get('normalized_method1'):
+            self.and_equals('normalized_method1', kwargs['normalized_method1'])
+
+        if kwargs.get('normalized_method2'):
+            self.and_equals('normalized_method2', kwargs['normalized_method2'])
+
+        if kwargs.get('gene_type', -1) != -1:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene_type', kwargs['gene_type'])
+            else:
+                self.and_equals('normalized_gene_type', kwargs['gene_type'])
+
+        return self.rows()[0]
+
+    @promise_query
+    @memoized
+    @summarized
     def total_variants_by_gene(self, **kwargs):
         if kwargs.get('original_genes'):
             self.query = 'SELECT gene'
@@ -658,10 +1225,10 @@ class DB():
             self.query = 'SELECT normalized_gene AS gene'
 
         self.query += '''
-            , COUNT(DISTINCT condition1_name) AS condition_count
+            , COUNT(DISTINCT condition1_key) AS condition_count
             , COUNT(DISTINCT submitter1_id) AS submitter_count
-            , COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
+            , COUNT(DISTINCT variant_key) AS count
+            FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -673,7 +1240,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('condition1_name'):
@@ -707,20 +1274,77 @@ class DB():
                 self.and_equals('normalized_gene', kwargs['gene'])
 
         if kwargs.get('original_genes'):
-            self.query += ' GROUP BY gene ORDER BY count DESC'
+            self.query += ' GROUP BY gene_key ORDER BY count DESC'
+        else:
+            self.query += ' GROUP BY normalized_gene_key ORDER BY count DESC'
+
+        return self.rows()
+
+    @promise_query
+    @memoized
+    def total_variants_by_gene_and_conflict_threshold(self, **kwargs):
+        if kwargs.get('original_genes'):
+            self.query = 'SELECT gene, '
+        else:
+            self.query = 'SELECT normalized_gene AS gene, '
+
+        self.query += self.conflict_threshold_columns() + '''
+            FROM ''' + self.variant_comparisons_table(kwargs, True) + '''
+            WHERE
+                star_level1>=:min_stars1 AND
+                star_level2>=:min_stars2 AND
+                date=:date
+        '''
+
+        self.parameters = {
+            'min_stars1': kwargs.get('min_stars1', 0),
+            'min_stars2': kwargs.get('min_stars2', 0),
+            'min_conflict_level': kwargs.get('min_conflict_level', 1),
+            'date': self.partition(kwargs.get('date')),
+        }
+
+        if kwargs.get('condition1_name'):
+            self.and_equals('condition1_name', kwargs['condition1_name'])
+
+        if kwargs.get('submitter1_id'):
+            self.and_equals('submitter1_id', kwargs['submitter1_id'])
+
+        if kwargs.get('normalized_method1'):
+            self.and_equals('normalized_method1', kwargs['normalized_method1'])
+
+        if kwargs.get('normalized_method2'):
+            self.and_equals('normalized_method2', kwargs['normalized_method2'])
+
+        if kwargs.get('gene_type', -1) != -1:
+            if kwargs.get('original_genes'):
+                self.and_equals('gene_type', kwargs['gene_type'])
+            else:
+                self.and_equals('normalized_gene_type', kwargs['gene_type'])
+
+        if kwargs.get('gene'):
+            if kwargs.get('original_genes'):
+                self.and_equals('gene', kwargs['gene'])
+            else:
+                self.and_equals('normalized_gene', kwargs['gene'])
+
+        if kwargs.get('original_genes'):
+            self.query += ' GROUP BY gene_key'
         else:
-            self.query += ' GROUP BY normalized_gene ORDER BY count DESC'
+            self.query += ' GROUP BY normalized_gene_key'
+
+        self.query += ' HAVING in_conflict ORDER BY in_conflict DESC'
 
         return self.rows()
 
-    @promise
+    @promise_query
+    @memoized
     def total_variants_by_gene_and_significance(self, **kwargs):
         if kwargs.get('original_genes'):
             self.query = 'SELECT gene'
         else:
             self.query = 'SELECT normalized_gene AS gene'
 
-        self.query += ', COUNT(DISTINCT variant_name) AS count'
+        self.query += ', COUNT(DISTINCT variant_key) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
@@ -740,7 +1364,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('condition1_name'):
@@ -762,15 +1386,22 @@ class DB():
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
         if kwargs.get('original_genes'):
-            self.query += ' GROUP BY gene, significance'
+            self.query += ' GROUP BY gene_key'
+        else:
+            self.query += ' GROUP BY normalized_gene_key'
+
+        if kwargs.get('original_terms'):
+            self.query += ', significance1_key'
         else:
-            self.query += ' GROUP BY normalized_gene, significance'
+            self.query += ', normalized_significance1_key'
 
         return self.rows()
 
-    @promise
+    @promise_query
+    @memoized
+    @summarized
     def total_variants_by_significance(self, **kwargs):
-        self.query = 'SELECT COUNT(DISTINCT variant_name) AS count'
+        self.query = 'SELECT COUNT(DISTINCT variant_key) AS count'
 
         if kwargs.get('original_terms'):
             self.query += ', significance1 AS significance'
@@ -778,14 +1409,14 @@ class DB():
             self.query += ', normalized_significance1 AS significance'
 
         if kwargs.get('original_genes'):
-            self.query += ', COUNT(DISTINCT gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT gene_key) AS gene_count'
         else:
-            self.query += ', COUNT(DISTINCT normalized_gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT normalized_gene_key) AS gene_count'
 
         self.query += '''
-            , COUNT(DISTINCT condition1_name) AS condition_count
+            , COUNT(DISTINCT condition1_key) AS condition_count
             , COUNT(DISTINCT submitter1_id) AS submitter_count
-            FROM comparisons
+            FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -797,7 +1428,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -824,11 +1455,16 @@ class DB():
             else:
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
-        self.query += ' GROUP BY significance ORDER BY count DESC'
+        if kwargs.get('original_terms'):
+            self.query += ' GROUP BY significance1_key ORDER BY count DESC'
+        else:
+            self.query += ' GROUP BY normalized_significance1_key ORDER BY count DESC'
 
         return self.rows()
 
-    @promise
+    @promise_query
+    @memoized
+    @summarized
     def total_variants_by_submitter(self, **kwargs):
         if type(kwargs.get('submitter1_id')) is not int:
             self.query = 'SELECT submitter1_id AS submitter_id, submitter1_name AS submitter_name'
@@ -836,13 +1472,13 @@ class DB():
             self.query = 'SELECT submitter2_id AS submitter_id, submitter2_name AS submitter_name'
 
         if kwargs.get('original_genes'):
-            self.query += ', COUNT(DISTINCT gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT gene_key) AS gene_count'
         else:
-            self.query += ', COUNT(DISTINCT normalized_gene) AS gene_count'
+            self.query += ', COUNT(DISTINCT normalized_gene_key) AS gene_count'
 
         self.query += '''
-            , COUNT(DISTINCT condition1_name) AS condition_count
-            , COUNT(DISTINCT variant_name) AS count
+            , COUNT(DISTINCT condition1_key) AS condition_count
+            , COUNT(DISTINCT variant_key) AS count
             FROM comparisons
             WHERE
                 star_level1>=:min_stars1 AND
@@ -855,7 +1491,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -895,29 +1531,27 @@ class DB():
 
         return self.rows()
 
-    @promise
-    def total_variants_by_submitter_and_significance(self, **kwargs):
-        self.query = 'SELECT submitter1_id AS submitter_id, COUNT(DISTINCT variant_name) AS count'
-
-        if kwargs.get('original_terms'):
-            self.query += ', significance1 AS significance'
+    @promise_query
+    @memoized
+    def total_variants_by_submitter_and_conflict_threshold(self, **kwargs):
+        if type(kwargs.get('submitter1_id')) is not int:
+            self.query = 'SELECT submitter1_id AS submitter_id, submitter1_name AS submitter_name, '
         else:
-            self.query += ', normalized_significance1 AS significance'
+            self.query = 'SELECT submitter2_id AS submitter_id, submitter2_name AS submitter_name, '
 
-        self.query += '''
+        self.query += self.conflict_threshold_columns() + '''
             FROM comparisons
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
                 date=:date
         '''
 
         self.parameters = {
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'min_conflict_level': kwargs.get('min_conflict_level', 1),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -929,6 +1563,9 @@ class DB():
         if kwargs.get('condition1_name'):
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
+        if kwargs.get('submitter1_id'):
+            self.and_equals('submitter1_id', kwargs['submitter1_id'])
+
         if kwargs.get('normalized_method1'):
             self.and_equals('normalized_method1', kwargs['normalized_method1'])
 
@@ -941,52 +1578,22 @@ class DB():
             else:
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
-        self.query += ' GROUP BY submitter_id, significance'
+        self.query += ' GROUP BY submitter_id HAVING in_conflict ORDER BY in_conflict DESC'
 
         return self.rows()
 
+    @promise_query
+    @memoized
+    def total_variants_by_submitter_and_significance(self, **kwargs):
+        self.query = 'SELECT submitter1_id AS submitter_id, COUNT(DISTINCT variant_key) AS count'
 
-    @promise
-    def total_variants_in_conflict_by_condition_and_conflict_level(self, **kwargs):
-        if type(kwargs.get('condition1_name')) is not str:
-            self.query = 'SELECT condition1_name AS condition_name'
+        if kwargs.get('original_terms'):
+            self.query += ', significance1 AS significance'
         else:
-            self.query = 'SELECT condition2_name AS condition_name'
+            self.query += ', normalized_significance1 AS significance'
 
         self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
-            WHERE
-                star_level1>=:min_stars1 AND
-                star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
-                date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('condition1_name'):
-            self.and_equals('condition1_name', kwargs['condition1_name'])
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        self.query += ' GROUP BY condition_name, conflict_level'
-
-        return self.rows()
-
-    @promise
-    def total_variants_in_conflict_by_conflict_level(self, **kwargs):
-        self.query = '''
-            SELECT conflict_level, COUNT(DISTINCT variant_name) AS count FROM comparisons
+            FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -997,8 +1604,8 @@ class DB():
         self.parameters = {
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
+            'min_conflict_level': kwargs.get('min_conflict_level', -1),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -1010,12 +1617,6 @@ class DB():
         if kwargs.get('condition1_name'):
             self.and_equals('condition1_name', kwargs['condition1_name'])
 
-        if kwargs.get('submitter1_id'):
-            self.and_equals('submitter1_id', kwargs['submitter1_id'])
-
-        if kwargs.get('submitter2_id'):
-            self.and_equals('submitter2_id', kwargs['submitter2_id'])
-
         if kwargs.get('normalized_method1'):
             self.and_equals('normalized_method1', kwargs['normalized_method1'])
 
@@ -1028,60 +1629,16 @@ class DB():
             else:
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
-        self.query += ' GROUP BY conflict_level'
-
-        return self.rows()
-
-    @promise
-    def total_variants_in_conflict_by_gene_and_conflict_level(self, **kwargs):
-        if kwargs.get('original_genes'):
-            self.query = 'SELECT gene'
-        else:
-            self.query = 'SELECT normalized_gene AS gene'
-
-        self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
-            WHERE
-                star_level1>=:min_stars1 AND
-                star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
-                date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        if kwargs.get('gene_type', -1) != -1:
-            if kwargs.get('original_genes'):
-                self.and_equals('gene_type', kwargs['gene_type'])
-            else:
-                self.and_equals('normalized_gene_type', kwargs['gene_type'])
-
-        if kwargs.get('gene'):
-            if kwargs.get('original_genes'):
-                self.and_equals('gene', kwargs['gene'])
-            else:
-                self.and_equals('normalized_gene', kwargs['gene'])
-
-        if kwargs.get('original_genes'):
-            self.query += ' GROUP BY gene, conflict_level'
+        if kwargs.get('original_terms'):
+            self.query += ' GROUP BY submitter_id, significance1_key'
         else:
-            self.query += ' GROUP BY normalized_gene, conflict_level'
+            self.query += ' GROUP BY submitter_id, normalized_significance1_key'
 
         return self.rows()
 
-    @promise
+
+    @promise_query
+    @memoized
     def total_variants_in_conflict_by_significance_and_significance(self, **kwargs):
         if kwargs.get('original_terms'):
             self.query = 'SELECT significance1, significance2'
@@ -1090,7 +1647,12 @@ class DB():
                 SELECT normalized_significance1 AS significance1, normalized_significance2 AS significance2
             '''
 
-        self.query += ', conflict_level, COUNT(DISTINCT variant_name) AS count FROM comparisons'
+        #without submitter or condition filters, the pairs of significances can be made from the counts of each
+        #significance on each variant instead of from every pair of submissions
+        if self.is_variant_query(kwargs):
+            self.query += ', conflict_level, COUNT(DISTINCT variant_key) AS count FROM histogram_comparisons'
+        else:
+            self.query += ', conflict_level, COUNT(DISTINCT variant_key) AS count FROM comparisons'
 
         self.query += '''
             WHERE
@@ -1104,7 +1666,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -1135,52 +1697,16 @@ class DB():
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
         if kwargs.get('original_terms'):
-            self.query += ' GROUP BY significance1, significance2'
+            self.query += ' GROUP BY significance1_key, significance2_key'
         else:
-            self.query += ' GROUP BY normalized_significance1, normalized_significance2'
-
-        return self.rows()
-
-    @promise
-    def total_variants_in_conflict_by_submitter_and_conflict_level(self, **kwargs):
-        if type(kwargs.get('submitter1_id')) is not int:
-            self.query = 'SELECT submitter1_id AS submitter_id'
-        else:
-            self.query = 'SELECT submitter2_id AS submitter_id'
-
-        self.query += '''
-            , conflict_level, COUNT(DISTINCT variant_name) AS count
-            FROM comparisons
-            WHERE
-                star_level1>=:min_stars1 AND
-                star_level2>=:min_stars2 AND
-                conflict_level>=:min_conflict_level AND
-                date=:date
-        '''
-
-        self.parameters = {
-            'min_stars1': kwargs.get('min_stars1', 0),
-            'min_stars2': kwargs.get('min_stars2', 0),
-            'min_conflict_level': kwargs.get('min_conflict_level', 1),
-            'date': kwargs.get('date') or self.max_date(),
-        }
-
-        if kwargs.get('submitter1_id'):
-            self.and_equals('submitter1_id', kwargs['submitter1_id'])
-
-        if kwargs.get('normalized_method1'):
-            self.and_equals('normalized_method1', kwargs['normalized_method1'])
-
-        if kwargs.get('normalized_method2'):
-            self.and_equals('normalized_method2', kwargs['normalized_method2'])
-
-        self.query += ' GROUP BY submitter_id, conflict_level'
+            self.query += ' GROUP BY normalized_significance1_key, normalized_significance2_key'
 
         return self.rows()
 
+    @memoized
     def total_variants_without_significance(self, **kwargs):
         self.query = '''
-            SELECT COUNT(DISTINCT variant_name) FROM comparisons
+            SELECT COUNT(DISTINCT variant_key) FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -1192,14 +1718,20 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
             'significance': kwargs['significance'],
         }
 
         if kwargs.get('original_terms'):
-            self.query += ' AND significance1!=:significance AND significance2!=:significance'
+            self.query += '''
+                AND significance1_key NOT IN (SELECT id FROM significances WHERE name=:significance)
+                AND significance2_key NOT IN (SELECT id FROM significances WHERE name=:significance)
+            '''
         else:
-            self.query += ' AND normalized_significance1!=:significance AND normalized_significance2!=:significance'
+            self.query += '''
+                AND normalized_significance1_key NOT IN (SELECT id FROM significances WHERE name=:significance)
+                AND normalized_significance2_key NOT IN (SELECT id FROM significances WHERE name=:significance)
+            '''
 
         if kwargs.get('normalized_method1'):
             self.and_equals('normalized_method1', kwargs['normalized_method1'])
@@ -1218,8 +1750,11 @@ class DB():
     def variant_info(self, variant_name, date = None):
         try:
             row = list(self.cursor.execute(
-                'SELECT variant_id, rsid FROM submissions WHERE variant_name=? AND date=? LIMIT 1',
-                [variant_name, date or self.max_date()]
+                '''
+                    SELECT variant_id, rsid FROM submission_facts
+                    WHERE variant_key=(SELECT id FROM variants WHERE name=?) AND date=? LIMIT 1
+                ''',
+                [variant_name, self.partition(date)]
             ))[0]
             return {'id': row[0], 'name': variant_name, 'rsid': row[1]}
         except IndexError:
@@ -1229,7 +1764,7 @@ class DB():
         try:
             return list(self.cursor.execute(
                 'SELECT variant_name FROM submissions WHERE rcv=? AND date=? LIMIT 1',
-                [rcv, date or self.max_date()]
+                [rcv, self.partition(date)]
             ))[0][0]
         except IndexError:
             return None
@@ -1237,7 +1772,7 @@ class DB():
     def variant_name_from_rsid(self, rsid, date = None):
         rows = list(self.cursor.execute(
             'SELECT DISTINCT variant_name FROM submissions WHERE rsid=? AND date=?',
-            [rsid, date or self.max_date()]
+            [rsid, self.partition(date)]
         ))
         return rows[0][0] if len(rows) == 1 else None
 
@@ -1245,15 +1780,16 @@ class DB():
         try:
             return list(self.cursor.execute(
                 'SELECT variant_name FROM submissions WHERE scv=? AND date=? LIMIT 1',
-                [scv, date or self.max_date()]
+                [scv, self.partition(date)]
             ))[0][0]
         except IndexError:
             return None
 
-    @promise
+    @promise_query
+    @memoized
     def variants(self, **kwargs):
         self.query = '''
-            SELECT variant_name, rsid FROM comparisons
+            SELECT variant_name, rsid FROM ''' + self.comparisons_table(kwargs) + '''
             WHERE
                 star_level1>=:min_stars1 AND
                 star_level2>=:min_stars2 AND
@@ -1265,7 +1801,7 @@ class DB():
             'min_stars1': kwargs.get('min_stars1', 0),
             'min_stars2': kwargs.get('min_stars2', 0),
             'min_conflict_level': kwargs.get('min_conflict_level', -1),
-            'date': kwargs.get('date') or self.max_date(),
+            'date': self.partition(kwargs.get('date')),
         }
 
         if kwargs.get('gene') != None:
@@ -1307,6 +1843,6 @@ class DB():
             else:
                 self.and_equals('normalized_gene_type', kwargs['gene_type'])
 
-        self.query += ' GROUP BY variant_name ORDER BY variant_name'
+        self.query += ' GROUP BY variant_key ORDER BY variant_name'
 
         return self.rows()
@@ -1,19 +1,27 @@
 #!/usr/bin/env python3
 
+from argparse import ArgumentParser
 from collections import OrderedDict
 from copy import copy
-from functools import partial
-from mmap import mmap
+from functools import lru_cache, partial
+from hashlib import blake2b
+from itertools import chain, groupby
 from mondo import Mondo
-from multiprocessing import Pool
-from os.path import basename, getsize
-from psutil import virtual_memory
+from multiprocessing import Pool, cpu_count
+from operator import itemgetter
+from os import remove, replace
+from os.path import basename, exists
 from pycountry import countries
-from sys import argv
+from queue import Queue
+from threading import BoundedSemaphore, Thread
+from uuid import uuid4
 from xml.etree import ElementTree
+from xml.parsers import expat
 import csv
+import gzip
 import re
 import sqlite3
+import sys
 
 nonstandard_significance_term_map = dict(map(
     lambda line: line[0:-1].split('\t'),
@@ -34,86 +42,476 @@ standard_methods = [
     'research',
 ]
 
-def connect():
-    return sqlite3.connect('clinvar.db', timeout=600)
+def connect(filename = 'clinvar.db'):
+    return sqlite3.connect(filename, timeout=600, check_same_thread=False)
 
-def create_tables():
-    db = connect()
-    cursor = db.cursor()
+catalog_filename = 'clinvar-partitions.db'
+
+def is_partitioned():
+    return exists(catalog_filename)
+
+def create_catalog():
+    catalog = connect(catalog_filename)
+    catalog.execute('CREATE TABLE IF NOT EXISTS partitions (date TEXT PRIMARY KEY, filename TEXT)')
+    create_summaries_table(catalog.cursor())
+    catalog.commit()
+    catalog.close()
+
+def update_generation():
+    #the website keeps the pages that it renders until the database that it reads has a new generation
+    db = connect(catalog_filename if is_partitioned() else 'clinvar.db')
+    db.execute('CREATE TABLE IF NOT EXISTS generation (id TEXT)')
+    db.execute('DELETE FROM generation')
+    db.execute('INSERT INTO generation VALUES (?)', [uuid4().hex])
+    db.commit()
+    db.close()
+
+#text values that repeat across many rows are stored once in a dimension table and referred to by their integer keys
+dimensions = OrderedDict([
+    ('variants', ['name']),
+    ('genes', ['name']),
+    ('submitters', ['submitter_id', 'name', 'country_code', 'country_name']),
+    ('conditions', ['name']),
+    ('significances', ['name']),
+    ('methods', ['name']),
+])
+
+submission_columns = '''
+    variant_id INTEGER,
+    variant_key INTEGER,
+    rsid TEXT,
+    gene_key INTEGER,
+    gene_type INTEGER,
+    normalized_gene_key INTEGER,
+    normalized_gene_type INTEGER,
+    submitter_id INTEGER,
+    submitter_key INTEGER,
+    rcv TEXT,
+    scv TEXT,
+    significance_key INTEGER,
+    normalized_significance_key INTEGER,
+    last_eval TEXT,
+    review_status TEXT,
+    star_level INTEGER,
+    condition_key INTEGER,
+    condition_xrefs TEXT,
+    method_key INTEGER,
+    normalized_method_key INTEGER,
+    comment TEXT
+'''
+
+#the rest of the first submission's columns are looked up in submission_facts
+comparison_columns = '''
+    variant_id TEXT,
+    variant_key INTEGER,
+    rsid TEXT,
+    gene_key INTEGER,
+    gene_type INTEGER,
+    normalized_gene_key INTEGER,
+    normalized_gene_type INTEGER,
+
+    submitter1_id INTEGER,
+    submitter1_key INTEGER,
+    scv1 TEXT,
+    significance1_key INTEGER,
+    normalized_significance1_key INTEGER,
+    star_level1 INTEGER,
+    condition1_key INTEGER,
+    method1_key INTEGER,
+    normalized_method1_key INTEGER,
+
+    submitter2_id INTEGER,
+    submitter2_key INTEGER,
+    scv2 TEXT,
+    significance2_key INTEGER,
+    normalized_significance2_key INTEGER,
+    star_level2 INTEGER,
+    condition2_key INTEGER,
+    normalized_method2_key INTEGER,
+
+    conflict_level INTEGER
+'''
+
+#a variant's comparisons mostly differ in columns that the variant-level counts don't filter on, so those counts read
+#the distinct combinations of the columns that they do filter on instead of every comparison
+variant_conflict_columns = '''
+    variant_key INTEGER,
+    gene_key INTEGER,
+    gene_type INTEGER,
+    normalized_gene_key INTEGER,
+    normalized_gene_type INTEGER,
+    star_level1 INTEGER,
+    normalized_method1_key INTEGER,
+    star_level2 INTEGER,
+    normalized_method2_key INTEGER,
+    conflict_level INTEGER
+'''
+
+#the conflict level of two submissions only depends on their significances, so submissions on the same variant that
+#agree on these columns are counted together, and pairs of these counts stand in for the pairs of submissions
+significance_histogram_columns = '''
+    variant_key INTEGER,
+    gene_key INTEGER,
+    gene_type INTEGER,
+    normalized_gene_key INTEGER,
+    normalized_gene_type INTEGER,
+    significance_key INTEGER,
+    normalized_significance_key INTEGER,
+    star_level INTEGER,
+    normalized_method_key INTEGER,
+    submissions INTEGER
+'''
+
+def is_temporal(db):
+    return bool(list(db.execute("SELECT 1 FROM sqlite_master WHERE name='submission_ranges'")))
+
+def create_range_table(cursor, table, view, columns, keys):
+    #each distinct row is stored once with the first and last dates that it appears in, and a view with a row for each
+    #date stands in for the table so that the importer and the website don't have to know the difference
+    cursor.execute('CREATE TABLE IF NOT EXISTS ' + table + ' (first_date TEXT, last_date TEXT,' + columns + ')')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ' + table + '__key ON ' + table + ' (' + ', '.join(keys) + ', last_date)'
+    )
+    cursor.execute('CREATE INDEX IF NOT EXISTS ' + table + '__last_date ON ' + table + ' (last_date)')
+
+    names = get_columns(cursor, table)[2:]
 
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS submissions (
-            date TEXT,
-            variant_id INTEGER,
-            variant_name TEXT,
-            rsid TEXT,
-            gene TEXT,
-            gene_type INTEGER,
-            normalized_gene TEXT,
-            normalized_gene_type INTEGER,
-            submitter_id INTEGER,
-            submitter_name TEXT,
-            submitter_country_code TEXT,
-            submitter_country_name TEXT,
-            rcv TEXT,
-            scv TEXT,
-            significance TEXT,
-            normalized_significance TEXT,
-            last_eval TEXT,
-            review_status TEXT,
-            star_level INTEGER,
-            condition_name TEXT,
-            condition_xrefs TEXT,
-            method TEXT,
-            normalized_method TEXT,
-            comment TEXT,
-            PRIMARY KEY (date, scv)
-        )
+        CREATE VIEW IF NOT EXISTS ''' + view + ''' AS
+        SELECT dates.date AS date, ''' + ', '.join(names) + '''
+        FROM dates INNER JOIN ''' + table + ''' ON dates.date BETWEEN first_date AND last_date
     ''')
 
+    #a row that is the same as in the previous import extends its range instead of being stored again
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS comparisons (
-            date TEXT,
-            variant_id TEXT,
-            variant_name TEXT,
-            rsid TEXT,
-            gene TEXT,
-            gene_type INTEGER,
-            normalized_gene TEXT,
-            normalized_gene_type INTEGER,
-
-            submitter1_id INTEGER,
-            submitter1_name TEXT,
-            submitter1_country_code TEXT,
-            submitter1_country_name TEXT,
-            rcv1 TEXT,
-            scv1 TEXT,
-            significance1 TEXT,
-            normalized_significance1 TEXT,
-            last_eval1 TEXT,
-            review_status1 TEXT,
-            star_level1 INTEGER,
-            condition1_name TEXT,
-            condition1_xrefs TEXT,
-            method1 TEXT,
-            normalized_method1 TEXT,
-            comment1 TEXT,
-
-            submitter2_id INTEGER,
-            submitter2_name TEXT,
-            scv2 TEXT,
-            significance2 TEXT,
-            normalized_significance2 TEXT,
-            star_level2 INTEGER,
-            condition2_name TEXT,
-            normalized_method2 TEXT,
+        CREATE TRIGGER IF NOT EXISTS ''' + view + '''__insert INSTEAD OF INSERT ON ''' + view + '''
+        BEGIN
+            INSERT OR IGNORE INTO dates VALUES (NEW.date);
 
-            conflict_level INTEGER,
+            UPDATE ''' + table + ''' SET last_date=NEW.date
+            WHERE
+                ''' + ' AND '.join(map(lambda key: key + '=NEW.' + key, keys)) + ''' AND
+                last_date=(SELECT MAX(date) FROM dates WHERE date<NEW.date) AND
+                ''' + ' AND '.join(map(lambda name: name + ' IS NEW.' + name, names)) + ''';
+
+            INSERT INTO ''' + table + '''
+            SELECT NEW.date, NEW.date, ''' + ', '.join(map(lambda name: 'NEW.' + name, names)) + '''
+            WHERE NOT EXISTS (
+                SELECT 1 FROM ''' + table + '''
+                WHERE ''' + ' AND '.join(map(lambda key: key + '=NEW.' + key, keys)) + ''' AND last_date=NEW.date
+            );
+        END
+    ''')
+
+def create_views(cursor):
+    #the views decode the keys so that the website and ad hoc queries can use the text columns, and because each text
+    #column is a subquery, SQLite only looks up the ones that a query actually uses
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS submissions AS
+        SELECT
+            date,
+            variant_id,
+            (SELECT name FROM variants WHERE id=f.variant_key) AS variant_name,
+            rsid,
+            (SELECT name FROM genes WHERE id=f.gene_key) AS gene,
+            gene_type,
+            (SELECT name FROM genes WHERE id=f.normalized_gene_key) AS normalized_gene,
+            normalized_gene_type,
+            submitter_id,
+            (SELECT name FROM submitters WHERE id=f.submitter_key) AS submitter_name,
+            (SELECT country_code FROM submitters WHERE id=f.submitter_key) AS submitter_country_code,
+            (SELECT country_name FROM submitters WHERE id=f.submitter_key) AS submitter_country_name,
+            rcv,
+            scv,
+            (SELECT name FROM significances WHERE id=f.significance_key) AS significance,
+            (SELECT name FROM significances WHERE id=f.normalized_significance_key) AS normalized_significance,
+            last_eval,
+            review_status,
+            star_level,
+            (SELECT name FROM conditions WHERE id=f.condition_key) AS condition_name,
+            condition_xrefs,
+            (SELECT name FROM methods WHERE id=f.method_key) AS method,
+            (SELECT name FROM methods WHERE id=f.normalized_method_key) AS normalized_method,
+            comment,
+            variant_key,
+            gene_key,
+            normalized_gene_key,
+            submitter_key,
+            significance_key,
+            normalized_significance_key,
+            condition_key,
+            method_key,
+            normalized_method_key
+        FROM submission_facts f
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS comparisons AS
+        SELECT
+            date,
+            variant_id,
+            (SELECT name FROM variants WHERE id=f.variant_key) AS variant_name,
+            rsid,
+            (SELECT name FROM genes WHERE id=f.gene_key) AS gene,
+            gene_type,
+            (SELECT name FROM genes WHERE id=f.normalized_gene_key) AS normalized_gene,
+            normalized_gene_type,
+
+            submitter1_id,
+            (SELECT name FROM submitters WHERE id=f.submitter1_key) AS submitter1_name,
+            (SELECT country_code FROM submitters WHERE id=f.submitter1_key) AS submitter1_country_code,
+            (SELECT country_name FROM submitters WHERE id=f.submitter1_key) AS submitter1_country_name,
+            (SELECT rcv FROM submission_facts WHERE date=f.date AND scv=f.scv1) AS rcv1,
+            scv1,
+            (SELECT name FROM significances WHERE id=f.significance1_key) AS significance1,
+            (SELECT name FROM significances WHERE id=f.normalized_significance1_key) AS normalized_significance1,
+            (SELECT last_eval FROM submission_facts WHERE date=f.date AND scv=f.scv1) AS last_eval1,
+            (SELECT review_status FROM submission_facts WHERE date=f.date AND scv=f.scv1) AS review_status1,
+            star_level1,
+            (SELECT name FROM conditions WHERE id=f.condition1_key) AS condition1_name,
+            (SELECT condition_xrefs FROM submission_facts WHERE date=f.date AND scv=f.scv1) AS condition1_xrefs,
+            (SELECT name FROM methods WHERE id=f.method1_key) AS method1,
+            (SELECT name FROM methods WHERE id=f.normalized_method1_key) AS normalized_method1,
+            (SELECT comment FROM submission_facts WHERE date=f.date AND scv=f.scv1) AS comment1,
+
+            submitter2_id,
+            (SELECT name FROM submitters WHERE id=f.submitter2_key) AS submitter2_name,
+            scv2,
+            (SELECT name FROM significances WHERE id=f.significance2_key) AS significance2,
+            (SELECT name FROM significances WHERE id=f.normalized_significance2_key) AS normalized_significance2,
+            star_level2,
+            (SELECT name FROM conditions WHERE id=f.condition2_key) AS condition2_name,
+            (SELECT name FROM methods WHERE id=f.normalized_method2_key) AS normalized_method2,
+
+            conflict_level,
+
+            variant_key,
+            gene_key,
+            normalized_gene_key,
+            submitter1_key,
+            significance1_key,
+            normalized_significance1_key,
+            condition1_key,
+            method1_key,
+            normalized_method1_key,
+            submitter2_key,
+            significance2_key,
+            normalized_significance2_key,
+            condition2_key,
+            normalized_method2_key
+        FROM comparison_facts f
+    ''')
+
+    #each submission's comparison with itself, made from the submissions for queries that the other submission of a
+    #pair can't affect
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS submission_comparisons AS
+        SELECT
+            date,
+            variant_id,
+            variant_name,
+            rsid,
+            gene,
+            gene_type,
+            normalized_gene,
+            normalized_gene_type,
+
+            submitter_id AS submitter1_id,
+            submitter_name AS submitter1_name,
+            submitter_country_code AS submitter1_country_code,
+            submitter_country_name AS submitter1_country_name,
+            rcv AS rcv1,
+            scv AS scv1,
+            significance AS significance1,
+            normalized_significance AS normalized_significance1,
+            last_eval AS last_eval1,
+            review_status AS review_status1,
+            star_level AS star_level1,
+            condition_name AS condition1_name,
+            condition_xrefs AS condition1_xrefs,
+            method AS method1,
+            normalized_method AS normalized_method1,
+            comment AS comment1,
+
+            submitter_id AS submitter2_id,
+            submitter_name AS submitter2_name,
+            scv AS scv2,
+            significance AS significance2,
+            normalized_significance AS normalized_significance2,
+            star_level AS star_level2,
+            condition_name AS condition2_name,
+            normalized_method AS normalized_method2,
+
+            -1 AS conflict_level,
+
+            variant_key,
+            gene_key,
+            normalized_gene_key,
+            submitter_key AS submitter1_key,
+            significance_key AS significance1_key,
+            normalized_significance_key AS normalized_significance1_key,
+            condition_key AS condition1_key,
+            method_key AS method1_key,
+            normalized_method_key AS normalized_method1_key,
+            submitter_key AS submitter2_key,
+            significance_key AS significance2_key,
+            normalized_significance_key AS normalized_significance2_key,
+            condition_key AS condition2_key,
+            normalized_method_key AS normalized_method2_key
+        FROM submissions
+    ''')
+
+    #like comparisons, but between the counts in significance_histograms, each count is compared with itself at conflict
+    #level -1 and, if it counts more than one submission, at conflict level 0 too
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS histogram_comparisons AS
+        SELECT
+            date,
+            variant_key,
+            (SELECT name FROM genes WHERE id=f.gene_key) AS gene,
+            gene_type,
+            (SELECT name FROM genes WHERE id=f.normalized_gene_key) AS normalized_gene,
+            normalized_gene_type,
+            (SELECT name FROM significances WHERE id=f.significance1_key) AS significance1,
+            (SELECT name FROM significances WHERE id=f.normalized_significance1_key) AS normalized_significance1,
+            star_level1,
+            (SELECT name FROM methods WHERE id=f.normalized_method1_key) AS normalized_method1,
+            (SELECT name FROM significances WHERE id=f.significance2_key) AS significance2,
+            (SELECT name FROM significances WHERE id=f.normalized_significance2_key) AS normalized_significance2,
+            star_level2,
+            (SELECT name FROM methods WHERE id=f.normalized_method2_key) AS normalized_method2,
+            conflict_level,
+            gene_key,
+            normalized_gene_key,
+            significance1_key,
+            normalized_significance1_key,
+            normalized_method1_key,
+            significance2_key,
+            normalized_significance2_key,
+            normalized_method2_key
+        FROM (
+            SELECT
+                h1.date AS date,
+                h1.variant_key AS variant_key,
+                h1.gene_key AS gene_key,
+                h1.gene_type AS gene_type,
+                h1.normalized_gene_key AS normalized_gene_key,
+                h1.normalized_gene_type AS normalized_gene_type,
+                h1.significance_key AS significance1_key,
+                h1.normalized_significance_key AS normalized_significance1_key,
+                h1.star_level AS star_level1,
+                h1.normalized_method_key AS normalized_method1_key,
+                h2.significance_key AS significance2_key,
+                h2.normalized_significance_key AS normalized_significance2_key,
+                h2.star_level AS star_level2,
+                h2.normalized_method_key AS normalized_method2_key,
+                CASE
+                    WHEN h1.rowid=h2.rowid THEN -1
+                    WHEN h1.significance_key=h2.significance_key THEN 0
+                    ELSE conflict_levels.conflict_level
+                END AS conflict_level
+            FROM significance_histograms h1
+            INNER JOIN significance_histograms h2 ON h2.date=h1.date AND h2.variant_key=h1.variant_key
+            INNER JOIN conflict_levels ON
+                conflict_levels.normalized_significance1_key=h1.normalized_significance_key AND
+                conflict_levels.normalized_significance2_key=h2.normalized_significance_key
+
+            UNION ALL
+
+            SELECT
+                date,
+                variant_key,
+                gene_key,
+                gene_type,
+                normalized_gene_key,
+                normalized_gene_type,
+                significance_key,
+                normalized_significance_key,
+                star_level,
+                normalized_method_key,
+                significance_key,
+                normalized_significance_key,
+                star_level,
+                normalized_method_key,
+                0
+            FROM significance_histograms WHERE submissions>1
+        ) f
+    ''')
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS variant_conflicts AS
+        SELECT
+            date,
+            variant_key,
+            (SELECT name FROM genes WHERE id=f.gene_key) AS gene,
+            gene_type,
+            (SELECT name FROM genes WHERE id=f.normalized_gene_key) AS normalized_gene,
+            normalized_gene_type,
+            star_level1,
+            (SELECT name FROM methods WHERE id=f.normalized_method1_key) AS normalized_method1,
+            star_level2,
+            (SELECT name FROM methods WHERE id=f.normalized_method2_key) AS normalized_method2,
+            conflict_level,
+            gene_key,
+            normalized_gene_key,
+            normalized_method1_key,
+            normalized_method2_key
+        FROM variant_conflict_facts f
+    ''')
+
+def create_tables(temporal = False):
+    db = connect()
+    cursor = db.cursor()
+
+    if list(cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='submissions'")):
+        raise Exception('clinvar.db was created before submissions were stored with keys and has to be created again')
+
+    if temporal and not is_temporal(db) and list(cursor.execute("SELECT 1 FROM sqlite_master WHERE name='submission_facts'")):
+        raise Exception('clinvar.db already has a full copy of the submissions for each date')
+
+    if (temporal or is_temporal(db)) and is_partitioned():
+        raise Exception('Temporal storage cannot be partitioned')
 
-            PRIMARY KEY (date, scv1, scv2)
+    for table, columns in dimensions.items():
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS ' + table + ' (id INTEGER PRIMARY KEY, ' +
+            ', '.join(map(lambda column: column + (' INTEGER' if column == 'submitter_id' else ' TEXT'), columns)) + ')'
+        )
+
+    if temporal or is_temporal(db):
+        cursor.execute('CREATE TABLE IF NOT EXISTS dates (date TEXT PRIMARY KEY)')
+        create_range_table(cursor, 'submission_ranges', 'submission_facts', submission_columns, ['scv'])
+        create_range_table(cursor, 'comparison_ranges', 'comparison_facts', comparison_columns, ['scv1', 'scv2'])
+    else:
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS submission_facts (date TEXT,' + submission_columns + ', PRIMARY KEY (date, scv))'
+        )
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS comparison_facts (date TEXT,' + comparison_columns + ', PRIMARY KEY (date, scv1, scv2))'
+        )
+
+    #the variant-level combinations are few enough to be stored for each date even in temporal storage
+    cursor.execute('CREATE TABLE IF NOT EXISTS variant_conflict_facts (date TEXT,' + variant_conflict_columns + ')')
+    cursor.execute('CREATE INDEX IF NOT EXISTS variant_conflicts__date ON variant_conflict_facts (date)')
+
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS significance_histograms (date TEXT,' + significance_histogram_columns + ')'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS significance_histograms__variant ON significance_histograms (date, variant_key)'
+    )
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conflict_levels (
+            normalized_significance1_key INTEGER,
+            normalized_significance2_key INTEGER,
+            conflict_level INTEGER,
+            PRIMARY KEY (normalized_significance1_key, normalized_significance2_key)
         )
     ''')
 
+    create_views(cursor)
+
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS mondo_clinvar_relationships (
             date TEXT,
@@ -124,6 +522,36 @@ def create_tables():
         )
     ''')
 
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS clinvarset_hashes (
+            date TEXT,
+            hash BLOB,
+            rcv TEXT,
+            PRIMARY KEY (date, hash)
+        )
+    ''')
+
+    create_summaries_table(cursor)
+
+def create_summaries_table(cursor):
+    #results of the listing page queries, which create-indexes.py fills in for each date
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summaries (
+            date TEXT,
+            method TEXT,
+            min_stars INTEGER,
+            normalized_method TEXT,
+            min_conflict_level INTEGER,
+            gene_type INTEGER,
+            original_genes INTEGER,
+            original_terms INTEGER,
+            result TEXT,
+            PRIMARY KEY (
+                date, method, min_stars, normalized_method, min_conflict_level, gene_type, original_genes, original_terms
+            )
+        )
+    ''')
+
 def get_gene_type(genes, small_variant):
     if len(genes) == 0:
         return 0 #intergenic
@@ -134,48 +562,23 @@ def get_gene_type(genes, small_variant):
     else:
         return 3 #multiple genes because variant is large
 
-def get_submissions(date, set_xml):
-    set_el = ElementTree.fromstring(set_xml)
+def make_submissions(date, rcv, variant_id, variant_name, rsid, measures, trait_names, trait_xrefs, assertions):
     submissions = []
 
-    reference_assertion_el = set_el.find('./ReferenceClinVarAssertion')
-    rcv = reference_assertion_el.find('./ClinVarAccession[@Type="RCV"]').attrib['Acc']
-
-    measure_set_el = reference_assertion_el.find('./MeasureSet')
-    genotype_set_el = reference_assertion_el.find('./GenotypeSet')
-
-    if genotype_set_el != None:
-        variant_id = 0
-        variant_name_el = genotype_set_el.find('./Name/ElementValue[@Type="Preferred"]')
-        measure_els = genotype_set_el.findall('./MeasureSet/Measure')
-    else:
-        variant_id = int(measure_set_el.attrib['ID'])
-        variant_name_el = measure_set_el.find('./Name/ElementValue[@Type="Preferred"]')
-        measure_els = measure_set_el.findall('./Measure')
-
-    variant_name = variant_name_el.text if variant_name_el != None else str(variant_id) #missing in old versions
-
-    rsid = ''
-    if len(measure_els) == 1:
-        rsid_el = measure_els[0].find('./XRef[@Type="rs"]')
-        if rsid_el != None:
-            rsid = 'rs' + rsid_el.attrib['ID']
-
     genes = set()
     small_variant = True
     first_variant_genes = None
 
     #loop through each individual variant in the compound variant
-    for i, measure_el in enumerate(measure_els):
+    for i, relationships in enumerate(measures):
         #loop through each gene associated with the variant
         variant_genes = set()
-        for relationship_el in measure_el.findall('./MeasureRelationship'):
-            if relationship_el.attrib['Type'] == 'genes overlapped by variant':
+        for relationship_type, relationship_gene in relationships:
+            if relationship_type == 'genes overlapped by variant':
                 small_variant = False #probably a large deletion
 
-            gene_el = relationship_el.find('./Symbol/ElementValue[@Type="Preferred"]')
-            if gene_el != None and gene_el.text: #blank in old versions
-                variant_genes.add(gene_el.text)
+            if relationship_gene: #blank in old versions
+                variant_genes.add(relationship_gene)
 
         #if the compound variant is small, each individual variant should be annotated with the same genes
         if i == 0:
@@ -192,18 +595,17 @@ def get_submissions(date, set_xml):
     normalized_gene = ', '.join(sorted(genes))
     normalized_gene_type = get_gene_type(genes, small_variant)
 
-    trait_name_els = reference_assertion_el.findall('./TraitSet/Trait/Name/ElementValue[@Type="Preferred"]')
-    if trait_name_els:
-        condition_name = '; '.join(map(lambda el: el.text, trait_name_els))
+    if trait_names:
+        condition_name = '; '.join(trait_names)
     else:
         condition_name = 'not specified'
 
     condition_xrefs = set()
-    for trait_xref_el in reference_assertion_el.findall('./TraitSet/Trait//XRef'):
-        if trait_xref_el.attrib.get('Type') == 'secondary' or 'ID' not in trait_xref_el.attrib:
+    for trait_xref in trait_xrefs:
+        if trait_xref.get('Type') == 'secondary' or 'ID' not in trait_xref:
             continue
-        condition_db = trait_xref_el.attrib['DB'].lower()
-        condition_id = trait_xref_el.attrib['ID']
+        condition_db = trait_xref['DB'].lower()
+        condition_id = trait_xref['ID']
         #check for the most popular databases first
         if condition_db == 'medgen':
             condition_xrefs.add('UMLS:' + condition_id)
@@ -224,19 +626,7 @@ def get_submissions(date, set_xml):
     condition_xrefs |= mondo.most_specific_matches(condition_name, condition_xrefs)
     condition_xrefs = ';'.join(sorted(condition_xrefs))
 
-    for assertion_el in set_el.findall('./ClinVarAssertion'):
-        scv_el = assertion_el.find('./ClinVarAccession[@Type="SCV"]')
-        scv = scv_el.attrib['Acc']
-
-        submission_id_el = assertion_el.find('./ClinVarSubmissionID')
-        significance_el = assertion_el.find('./ClinicalSignificance')
-        description_el = significance_el.find('./Description')
-        review_status_el = significance_el.find('./ReviewStatus')
-        method_el = assertion_el.find('./ObservedIn/Method/MethodType')
-        comment_el = significance_el.find('./Comment')
-
-        submitter_id = int(scv_el.attrib['OrgID']) if scv_el.attrib.get('OrgID') else 500139 #missing in old versions
-        submitter_name = submission_id_el.get('submitter', '') if submission_id_el != None else 'ClinVar Staff' #missing in old versions
+    for scv, submitter_id, submitter_name, significance, last_eval, review_status, method, comment in assertions:
         submitter_country_code = submitter_country_codes[submitter_id] if submitter_id in submitter_country_codes else ''
         if submitter_country_code:
             submitter_country = countries.get(alpha_3=submitter_country_code)
@@ -247,13 +637,8 @@ def get_submissions(date, set_xml):
         else:
             submitter_country_name = ''
 
-        significance = description_el.text.lower() if description_el != None else 'not provided'
         normalized_significance = nonstandard_significance_term_map.get(significance, significance)
-        last_eval = significance_el.attrib.get('DateLastEvaluated', '') #missing in old versions
-        review_status = review_status_el.text if review_status_el != None else '' #missing in old versions
-        method = method_el.text if method_el != None else 'not provided' #missing in old versions
         normalized_method = method if method in standard_methods else 'other'
-        comment = comment_el.text if comment_el != None else ''
 
         if review_status in ['criteria provided, single submitter', 'criteria provided, conflicting interpretations']:
             star_level = 1
@@ -293,68 +678,720 @@ def get_submissions(date, set_xml):
 
     return submissions
 
-def import_file(filename):
-    with open(filename, 'r+b') as f:
-        doc = mmap(f.fileno(), 0)
-        for ev, el in ElementTree.iterparse(doc, events=['start']):
-            if el.tag == 'ReleaseSet':
-                date = el.attrib['Dated'][:7]
-                break
-        #hack the ClinVar XML file into pieces to parse it in parallel (if memory permits)
-        clinvarsets = re.findall(b'<ClinVarSet .+?</ClinVarSet>', doc, re.DOTALL)
-    if virtual_memory().available >= getsize(filename) * 2:
-        submission_sets = Pool().map(partial(get_submissions, date), clinvarsets)
+def get_submissions(date, set_xml):
+    set_el = ElementTree.fromstring(set_xml)
+
+    reference_assertion_el = set_el.find('./ReferenceClinVarAssertion')
+    rcv = reference_assertion_el.find('./ClinVarAccession[@Type="RCV"]').attrib['Acc']
+
+    measure_set_el = reference_assertion_el.find('./MeasureSet')
+    genotype_set_el = reference_assertion_el.find('./GenotypeSet')
+
+    if genotype_set_el != None:
+        variant_id = 0
+        variant_name_el = genotype_set_el.find('./Name/ElementValue[@Type="Preferred"]')
+        measure_els = genotype_set_el.findall('./MeasureSet/Measure')
     else:
-        submission_sets = map(partial(get_submissions, date), clinvarsets)
-    submissions = [submission for submission_set in submission_sets for submission in submission_set]
+        variant_id = int(measure_set_el.attrib['ID'])
+        variant_name_el = measure_set_el.find('./Name/ElementValue[@Type="Preferred"]')
+        measure_els = measure_set_el.findall('./Measure')
 
-    #do all the database imports at once to minimize the time that we hold the database lock
-    db = connect()
-    cursor = db.cursor()
+    variant_name = variant_name_el.text if variant_name_el != None else str(variant_id) #missing in old versions
+
+    rsid = ''
+    if len(measure_els) == 1:
+        rsid_el = measure_els[0].find('./XRef[@Type="rs"]')
+        if rsid_el != None:
+            rsid = 'rs' + rsid_el.attrib['ID']
+
+    measures = []
+    for measure_el in measure_els:
+        relationships = []
+        for relationship_el in measure_el.findall('./MeasureRelationship'):
+            gene_el = relationship_el.find('./Symbol/ElementValue[@Type="Preferred"]')
+            relationships.append((relationship_el.attrib['Type'], gene_el.text if gene_el != None else None))
+        measures.append(relationships)
+
+    trait_names = list(map(
+        lambda el: el.text,
+        reference_assertion_el.findall('./TraitSet/Trait/Name/ElementValue[@Type="Preferred"]')
+    ))
+
+    trait_xrefs = list(map(lambda el: el.attrib, reference_assertion_el.findall('./TraitSet/Trait//XRef')))
+
+    assertions = []
+    for assertion_el in set_el.findall('./ClinVarAssertion'):
+        scv_el = assertion_el.find('./ClinVarAccession[@Type="SCV"]')
+        scv = scv_el.attrib['Acc']
 
-    cursor.executemany(
-        'INSERT OR REPLACE INTO submissions VALUES (' + ','.join('?' * len(submissions[0])) + ')', submissions
+        submission_id_el = assertion_el.find('./ClinVarSubmissionID')
+        significance_el = assertion_el.find('./ClinicalSignificance')
+        description_el = significance_el.find('./Description')
+        review_status_el = significance_el.find('./ReviewStatus')
+        method_el = assertion_el.find('./ObservedIn/Method/MethodType')
+        comment_el = significance_el.find('./Comment')
+
+        submitter_id = int(scv_el.attrib['OrgID']) if scv_el.attrib.get('OrgID') else 500139 #missing in old versions
+        submitter_name = submission_id_el.get('submitter', '') if submission_id_el != None else 'ClinVar Staff' #missing in old versions
+        significance = description_el.text.lower() if description_el != None else 'not provided'
+        last_eval = significance_el.attrib.get('DateLastEvaluated', '') #missing in old versions
+        review_status = review_status_el.text if review_status_el != None else '' #missing in old versions
+        method = method_el.text if method_el != None else 'not provided' #missing in old versions
+        comment = comment_el.text if comment_el != None else ''
+
+        assertions.append((scv, submitter_id, submitter_name, significance, last_eval, review_status, method, comment))
+
+    return make_submissions(date, rcv, variant_id, variant_name, rsid, measures, trait_names, trait_xrefs, assertions)
+
+#(parent role, tag) -> role of the elements that get_submissions_expat looks at; everything else is skipped
+expat_roles = {
+    (None, 'ClinVarSet'): 'set',
+    ('set', 'ReferenceClinVarAssertion'): 'reference_assertion',
+    ('reference_assertion', 'ClinVarAccession'): 'rcv',
+    ('reference_assertion', 'MeasureSet'): 'measure_set',
+    ('reference_assertion', 'GenotypeSet'): 'genotype_set',
+    ('reference_assertion', 'TraitSet'): 'trait_set',
+    ('measure_set', 'Name'): 'variant_name',
+    ('measure_set', 'Measure'): 'measure',
+    ('genotype_set', 'Name'): 'variant_name',
+    ('genotype_set', 'MeasureSet'): 'genotype_measure_set',
+    ('genotype_measure_set', 'Measure'): 'measure',
+    ('variant_name', 'ElementValue'): 'variant_name_value',
+    ('measure', 'XRef'): 'rsid',
+    ('measure', 'MeasureRelationship'): 'relationship',
+    ('relationship', 'Symbol'): 'symbol',
+    ('symbol', 'ElementValue'): 'symbol_value',
+    ('trait_set', 'Trait'): 'trait',
+    ('trait', 'Name'): 'trait_name',
+    ('trait_name', 'ElementValue'): 'trait_name_value',
+    ('set', 'ClinVarAssertion'): 'assertion',
+    ('assertion', 'ClinVarAccession'): 'scv',
+    ('assertion', 'ClinVarSubmissionID'): 'submission_id',
+    ('assertion', 'ClinicalSignificance'): 'significance',
+    ('assertion', 'ObservedIn'): 'observed_in',
+    ('observed_in', 'Method'): 'method',
+    ('method', 'MethodType'): 'method_type',
+    ('significance', 'Description'): 'description',
+    ('significance', 'ReviewStatus'): 'review_status',
+    ('significance', 'Comment'): 'comment',
+}
+
+def get_submissions_expat(date, set_xml):
+    #same result as get_submissions, but without building a tree or keeping any elements that we don't use
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+
+    roles = [None]
+    capture = []
+    skip_depth = 0
+    skip_xrefs = False
+    reference = {}
+    variants = {'measure_set': {'measures': []}, 'genotype_set': {'measures': []}}
+    trait_names = []
+    trait_xrefs = []
+    assertions = []
+    variant = None
+    measure = None
+    relationship = None
+    assertion = None
+
+    def start_capture(fields, key):
+        #like ElementTree, the text of an element is the text before its first child element
+        text = []
+        capture.append((fields, key, text))
+        parser.CharacterDataHandler = text.append
+
+    def finish_capture():
+        fields, key, text = capture.pop()
+        parser.CharacterDataHandler = None
+        if key == None:
+            fields.append(''.join(text) or None)
+        else:
+            fields[key] = ''.join(text) or None
+
+    def start(tag, attrib):
+        nonlocal variant, measure, relationship, assertion, skip_depth, skip_xrefs
+
+        if skip_depth:
+            skip_depth += 1
+            if skip_xrefs and tag == 'XRef':
+                trait_xrefs.append(attrib)
+            return
+
+        if capture:
+            finish_capture()
+
+        parent = roles[-1]
+        role = expat_roles.get((parent, tag))
+
+        if role == None:
+            #most of a ClinVarSet is irrelevant, so whole subtrees are skipped by only counting their depth
+            skip_depth = 1
+            skip_xrefs = parent in ('trait', 'trait_name', 'trait_name_value') #any cross-reference in a trait may identify the condition
+            if skip_xrefs and tag == 'XRef':
+                trait_xrefs.append(attrib)
+            return
+        elif role == 'assertion':
+            assertion = {}
+            assertions.append(assertion)
+        elif role in ('method_type', 'description', 'review_status', 'comment'):
+            if role not in assertion:
+                start_capture(assertion, role)
+        elif role == 'scv':
+            if attrib.get('Type') == 'SCV' and 'scv' not in assertion:
+                assertion['scv'] = attrib
+        elif role == 'submission_id':
+            if 'submission_id' not in assertion:
+                assertion['submission_id'] = attrib
+        elif role == 'significance':
+            if 'significance' in assertion:
+                role = 'ignored' #only the first one counts
+            else:
+                assertion['significance'] = attrib
+        elif role == 'measure':
+            measure = {'relationships': []}
+            variant['measures'].append(measure)
+        elif role == 'rsid':
+            if attrib.get('Type') == 'rs' and 'rsid' not in measure:
+                measure['rsid'] = attrib
+        elif role == 'relationship':
+            relationship = {'type': attrib['Type']}
+            measure['relationships'].append(relationship)
+        elif role == 'symbol_value':
+            if attrib.get('Type') == 'Preferred' and 'gene' not in relationship:
+                start_capture(relationship, 'gene')
+        elif role == 'trait_name_value':
+            if attrib.get('Type') == 'Preferred':
+                start_capture(trait_names, None)
+        elif role == 'variant_name_value':
+            if attrib.get('Type') == 'Preferred' and 'name' not in variant:
+                start_capture(variant, 'name')
+        elif role in ('measure_set', 'genotype_set'):
+            if 'attrib' in variants[role]:
+                role = 'ignored' #only the first one counts
+            else:
+                variant = variants[role]
+                variant['attrib'] = attrib
+        elif role == 'rcv':
+            if attrib.get('Type') == 'RCV' and 'rcv' not in reference:
+                reference['rcv'] = attrib['Acc']
+        elif role == 'reference_assertion':
+            if 'seen' in reference:
+                role = 'ignored' #only the first one counts
+            reference['seen'] = True
+
+        roles.append(role)
+
+    def end(tag):
+        nonlocal skip_depth
+        if skip_depth:
+            skip_depth -= 1
+            return
+        if capture:
+            finish_capture()
+        roles.pop()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.Parse(set_xml, True)
+
+    if 'attrib' in variants['genotype_set']:
+        variant_id = 0
+        variant = variants['genotype_set']
+    else:
+        variant = variants['measure_set']
+        variant_id = int(variant['attrib']['ID'])
+
+    variant_name = variant['name'] if 'name' in variant else str(variant_id) #missing in old versions
+
+    rsid = ''
+    if len(variant['measures']) == 1 and 'rsid' in variant['measures'][0]:
+        rsid = 'rs' + variant['measures'][0]['rsid']['ID']
+
+    measures = list(map(
+        lambda measure: list(map(
+            lambda relationship: (relationship['type'], relationship.get('gene')),
+            measure['relationships']
+        )),
+        variant['measures']
+    ))
+
+    submissions = []
+    for assertion in assertions:
+        submitter_id = int(assertion['scv']['OrgID']) if assertion['scv'].get('OrgID') else 500139 #missing in old versions
+        if 'submission_id' in assertion:
+            submitter_name = assertion['submission_id'].get('submitter', '')
+        else:
+            submitter_name = 'ClinVar Staff' #missing in old versions
+        submissions.append((
+            assertion['scv']['Acc'],
+            submitter_id,
+            submitter_name,
+            assertion['description'].lower() if 'description' in assertion else 'not provided',
+            assertion['significance'].get('DateLastEvaluated', ''), #missing in old versions
+            assertion.get('review_status', ''), #missing in old versions
+            assertion.get('method_type', 'not provided'), #missing in old versions
+            assertion.get('comment', ''),
+        ))
+
+    return make_submissions(
+        date, reference['rcv'], variant_id, variant_name, rsid, measures, trait_names, trait_xrefs, submissions
     )
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__date ON submissions (date)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS submissions__variant_name ON submissions (variant_name)')
+parsers = {
+    'elementtree': get_submissions,
+    'expat': get_submissions_expat,
+}
 
-    cursor.execute('''
-        INSERT OR REPLACE INTO comparisons
+def compare_parsers(date, set_xml):
+    results = []
+    for parse in parsers.values():
+        try:
+            results.append(parse(date, set_xml))
+        except Exception as e:
+            results.append(type(e).__name__)
+    return set_xml if results.count(results[0]) != len(results) else None
+
+def open_release(filename):
+    f = sys.stdin.buffer if filename == '-' else open(filename, 'rb')
+    if f.peek(2)[:2] != b'\x1f\x8b': #gzip magic number
+        return f
+    if filename == '-':
+        return gzip.GzipFile(fileobj=f)
+    f.close()
+    return gzip.open(filename)
+
+def read_chunks(f, chunk_size = 16 * 1024 * 1024):
+    #read and decompress in a separate thread so that it overlaps with splitting and parsing
+    chunks = Queue(4)
+
+    def read():
+        try:
+            for chunk in iter(partial(f.read, chunk_size), b''):
+                chunks.put(chunk)
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+
+    Thread(target=read, daemon=True).start()
+    for chunk in iter(chunks.get, None):
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+def get_release_date(header):
+    match = re.search(b'<ReleaseSet [^>]*Dated="([^"]*)"', header)
+    return match.group(1)[:7].decode()
+
+def get_clinvarsets(chunks):
+    #hack the ClinVar XML file into pieces one at a time so that only a chunk or two is ever in memory
+    start_tag = b'<ClinVarSet '
+    end_tag = b'</ClinVarSet>'
+    buf = b''
+    search_from = 0
+    for chunk in chunks:
+        buf += chunk
+        pos = 0
+        while True:
+            start = buf.find(start_tag, pos)
+            if start == -1:
+                pos = max(pos, len(buf) - len(start_tag) + 1) #keep the beginning of a tag split between chunks
+                search_from = 0
+                break
+            end = buf.find(end_tag, max(start, search_from))
+            if end == -1:
+                pos = start
+                search_from = len(buf) - len(end_tag) + 1 #don't rescan a large set every time a chunk is added
+                break
+            end += len(end_tag)
+            yield buf[start:end]
+            pos = end
+            search_from = 0
+        buf = buf[pos:]
+        search_from = max(0, search_from - pos)
+
+def throttle(items, semaphore, errors = ()):
+    #keep the pool from reading ahead of the workers and the writer, but stop reading once the writer has failed, because
+    #then nothing releases the semaphore and the pool would wait for this forever when it is terminated
+    for item in items:
+        while not semaphore.acquire(timeout=1):
+            if errors:
+                return
+        yield item
+
+def get_hash_key():
+    #the submissions from a ClinVarSet also depend on the importer and its lookup tables, but not on mondo.owl, which is
+    #downloaded again before every import, because the Mondo matches of reused submissions are redone instead
+    key = blake2b()
+    for filename in [__file__, 'nonstandard_significance_terms.tsv', 'submitter_info.tsv']:
+        with open(filename, 'rb') as f:
+            key.update(f.read())
+    return key.digest()
+
+def hash_clinvarsets(clinvarsets, key, previous_hashes, reused):
+    #sets that are byte-identical to a set in the previous import are not parsed again
+    for set_xml in clinvarsets:
+        set_hash = blake2b(set_xml, digest_size=16, key=key).digest()
+        if set_hash in previous_hashes:
+            reused.append(set_hash)
+        else:
+            yield set_hash, set_xml
+
+@lru_cache(maxsize=None)
+def rematch_mondo(condition_name, condition_xrefs):
+    #the same matches that make_submissions adds to the cross-references that ClinVar gives, none of which are Mondo's
+    xrefs = set(filter(lambda xref: xref and not xref.startswith('MONDO:'), (condition_xrefs or '').split(';')))
+    xrefs |= mondo.most_specific_matches(condition_name, xrefs)
+    return ';'.join(sorted(xrefs))
+
+def parse_hashed(parse, date, hashed_set):
+    set_hash, set_xml = hashed_set
+    return set_hash, parse(date, set_xml)
+
+def record_hashes(results, hashes):
+    for set_hash, submissions in results:
+        hashes.append((set_hash, submissions[0][12] if submissions else None)) #rcv
+        yield submissions
+
+def load_dimensions(db):
+    #maps the values in each dimension table to their keys
+    return {
+        table: dict(map(lambda row: (row[1:], row[0]), db.execute('SELECT * FROM ' + table)))
+        for table in dimensions
+    }
+
+def save_dimensions(db, keys):
+    for table, columns in dimensions.items():
+        max_key = db.execute('SELECT COALESCE(MAX(id), 0) FROM ' + table).fetchone()[0]
+        db.executemany(
+            'INSERT INTO ' + table + ' VALUES (' + ','.join('?' * (len(columns) + 1)) + ')',
+            map(lambda item: (item[1],) + item[0], filter(lambda item: item[1] > max_key, keys[table].items()))
+        )
+
+def get_key(keys, table, *value):
+    #new values are numbered here and saved by save_dimensions after the submissions are written
+    if value not in keys[table]:
+        keys[table][value] = len(keys[table]) + 1
+    return keys[table][value]
+
+def encode_submissions(submission_sets, keys):
+    for submissions in submission_sets:
+        yield list(map(
+            lambda row: (
+                row[0], #date
+                row[1], #variant_id
+                get_key(keys, 'variants', row[2]),
+                row[3], #rsid
+                get_key(keys, 'genes', row[4]),
+                row[5], #gene_type
+                get_key(keys, 'genes', row[6]),
+                row[7], #normalized_gene_type
+                row[8], #submitter_id
+                get_key(keys, 'submitters', row[8], row[9], row[10], row[11]),
+                row[12], #rcv
+                row[13], #scv
+                get_key(keys, 'significances', row[14]),
+                get_key(keys, 'significances', row[15]),
+                row[16], #last_eval
+                row[17], #review_status
+                row[18], #star_level
+                get_key(keys, 'conditions', row[19]),
+                row[20], #condition_xrefs
+                get_key(keys, 'methods', row[21]),
+                get_key(keys, 'methods', row[22]),
+                row[23], #comment
+            ),
+            submissions
+        ))
+
+def release(items, semaphore):
+    for item in items:
+        semaphore.release()
+        yield item
+
+def write_rows(cursor, table, batches, errors):
+    #a single connection does all of the writing so that the workers never contend for the database lock
+    for batch in iter(batches.get, None):
+        if errors:
+            continue #keep draining the queue so that the producer doesn't block
+        try:
+            cursor.executemany(
+                'INSERT OR REPLACE INTO ' + table + ' VALUES (' + ','.join('?' * len(batch[0])) + ')', batch
+            )
+        except Exception as e:
+            errors.append(e)
+
+def import_rows(db, table, row_sets, batch_size, queue_size, errors):
+    batches = Queue(queue_size)
+    writer = Thread(target=write_rows, args=(db.cursor(), table, batches, errors), daemon=True)
+    writer.start()
+
+    batch = []
+    for rows in row_sets:
+        if errors:
+            break #the import has already failed, so the rest of the release isn't parsed
+        batch += rows
+        if len(batch) >= batch_size:
+            batches.put(batch)
+            batch = []
+    if batch and not errors:
+        batches.put(batch)
+    batches.put(None)
+
+    writer.join()
+    if errors:
+        raise errors[0]
+
+def get_conflict_level(significance1, significance2):
+    #significances are normalized
+    if significance1 == 'not provided' or significance2 == 'not provided':
+        return 0
+
+    if significance1 == significance2:
+        return 1
+
+    if {significance1, significance2} in ({'benign', 'likely benign'}, {'pathogenic', 'likely pathogenic'}):
+        return 2
+
+    benign = ['benign', 'likely benign']
+    if significance1 in benign and significance2 == 'uncertain significance':
+        return 3
+    if significance1 == 'uncertain significance' and significance2 in benign:
+        return 3
+
+    pathogenic = ['pathogenic', 'likely pathogenic']
+    if significance1 in benign + ['uncertain significance'] and significance2 in pathogenic:
+        return 5
+    if significance1 in pathogenic and significance2 in benign + ['uncertain significance']:
+        return 5
+
+    return 4
+
+def compare_submissions(conflict_levels, submissions):
+    #every ordered pair of submissions on the same variant, including each submission paired with itself
+    comparisons = []
+    for scv1, significance1, normalized_significance1 in submissions:
+        for scv2, significance2, normalized_significance2 in submissions:
+            if scv1 == scv2:
+                conflict_level = -1
+            elif significance1 == significance2:
+                conflict_level = 0
+            else:
+                conflict_level = conflict_levels[(normalized_significance1, normalized_significance2)]
+            comparisons.append((scv1, scv2, conflict_level))
+    return comparisons
+
+def get_columns(db, table):
+    return list(map(lambda row: row[1], db.execute('PRAGMA table_info(' + table + ')')))
+
+def get_previous_date(db, date):
+    table = 'dates' if is_temporal(db) else 'submission_facts'
+    return db.execute('SELECT MAX(date) FROM ' + table + ' WHERE date<?', [date]).fetchone()[0]
+
+def forget_date(db, date):
+    #dates can only be added after the latest date in temporal storage, but the latest date can be imported again
+    latest_date = db.execute('SELECT MAX(date) FROM dates').fetchone()[0]
+    if latest_date and date < latest_date:
+        raise Exception('Cannot import ' + date + ' because ' + latest_date + ' has already been imported')
+
+    previous_date = get_previous_date(db, date)
+    for table in ['submission_ranges', 'comparison_ranges']:
+        db.execute('DELETE FROM ' + table + ' WHERE first_date=?', [date])
+        db.execute('UPDATE ' + table + ' SET last_date=? WHERE last_date=?', [previous_date, date])
+    db.execute('DELETE FROM dates WHERE date=?', [date])
+
+def copy_unchanged_comparisons(db, date):
+    #a variant's comparisons only depend on its own submissions, so if none of them were added, removed or changed
+    #since the previous import, its comparisons are copied from there instead of being recomputed
+    previous_date = get_previous_date(db, date)
+    submission_columns = ', '.join(get_columns(db, 'submission_facts')[1:])
+    comparison_columns = ', '.join(get_columns(db, 'comparison_facts')[1:])
+
+    db.execute('CREATE TEMP TABLE changed_variants (variant_key INTEGER PRIMARY KEY)')
+    for date1, date2 in [(date, previous_date), (previous_date, date)]:
+        db.execute('''
+            INSERT OR IGNORE INTO changed_variants
+            SELECT variant_key FROM (
+                SELECT ''' + submission_columns + ''' FROM submission_facts WHERE date=?
+                EXCEPT
+                SELECT ''' + submission_columns + ''' FROM submission_facts WHERE date=?
+            )
+        ''', [date1, date2])
+
+    db.execute('''
+        INSERT OR REPLACE INTO comparison_facts
+        SELECT ?, ''' + comparison_columns + ''' FROM comparison_facts
+        WHERE date=? AND variant_key NOT IN (SELECT variant_key FROM changed_variants)
+    ''', [date, previous_date])
+
+    reused, rebuilt = db.execute('''
+        SELECT
+            COUNT(DISTINCT CASE WHEN variant_key NOT IN (SELECT variant_key FROM changed_variants) THEN variant_key END),
+            COUNT(DISTINCT CASE WHEN variant_key IN (SELECT variant_key FROM changed_variants) THEN variant_key END)
+        FROM submission_facts WHERE date=?
+    ''', [date]).fetchone()
+    print(date + ': reused comparisons of ' + str(reused) + ' variants, rebuilt ' + str(rebuilt))
+
+def import_comparisons(db, date, workers, batch_size):
+    chunksize = 100
+
+    copy_unchanged_comparisons(db, date)
+
+    significances = dict(db.execute(
+        'SELECT DISTINCT normalized_significance_key, normalized_significance FROM submissions WHERE date=?', [date]
+    ))
+    conflict_levels = {
+        (key1, key2): get_conflict_level(significances[key1], significances[key2])
+        for key1 in significances for key2 in significances
+    }
+
+    db.executemany(
+        'INSERT OR REPLACE INTO conflict_levels VALUES (?,?,?)',
+        map(lambda keys: keys + (conflict_levels[keys],), conflict_levels)
+    )
+
+    #the pool only sends back SCVs and conflict levels, SQLite copies the rest of the columns
+    db.execute('CREATE TEMP TABLE comparison_levels (scv1 TEXT, scv2 TEXT, conflict_level INTEGER)')
+
+    submissions = db.cursor().execute('''
+        SELECT variant_key, scv, significance_key, normalized_significance_key
+        FROM submission_facts WHERE date=? AND variant_key IN (SELECT variant_key FROM changed_variants)
+        ORDER BY variant_key
+    ''', [date])
+    variants = map(
+        lambda group: tuple(map(lambda row: row[1:], group[1])),
+        groupby(submissions, itemgetter(0)) #variant_key
+    )
+
+    with Pool(workers) as pool:
+        in_flight = BoundedSemaphore(workers * chunksize * 4)
+        errors = []
+        comparison_sets = pool.imap_unordered(
+            partial(compare_submissions, conflict_levels), throttle(variants, in_flight, errors), chunksize
+        )
+        import_rows(db, 'comparison_levels', release(comparison_sets, in_flight), batch_size, workers * 2, errors)
+
+    db.execute('''
+        INSERT OR REPLACE INTO comparison_facts
         SELECT
-            t1.*,
+            t1.date,
+            t1.variant_id,
+            t1.variant_key,
+            t1.rsid,
+            t1.gene_key,
+            t1.gene_type,
+            t1.normalized_gene_key,
+            t1.normalized_gene_type,
+            t1.submitter_id,
+            t1.submitter_key,
+            t1.scv,
+            t1.significance_key,
+            t1.normalized_significance_key,
+            t1.star_level,
+            t1.condition_key,
+            t1.method_key,
+            t1.normalized_method_key,
             t2.submitter_id,
-            t2.submitter_name,
+            t2.submitter_key,
             t2.scv,
-            t2.significance,
-            t2.normalized_significance,
+            t2.significance_key,
+            t2.normalized_significance_key,
             t2.star_level,
-            t2.condition_name,
-            t2.normalized_method,
-            CASE
-                WHEN t1.scv=t2.scv THEN -1
+            t2.condition_key,
+            t2.normalized_method_key,
+            comparison_levels.conflict_level
+        FROM comparison_levels
+        INNER JOIN submission_facts t1 ON t1.date=:date AND t1.scv=comparison_levels.scv1
+        INNER JOIN submission_facts t2 ON t2.date=:date AND t2.scv=comparison_levels.scv2
+    ''', {'date': date})
+
+    db.execute('DROP TABLE comparison_levels')
+    db.execute('DROP TABLE changed_variants')
+
+    import_significance_histograms(db, date)
+    import_variant_conflicts(db, date)
+
+def import_significance_histograms(db, date):
+    columns = ', '.join(get_columns(db, 'significance_histograms')[1:-1])
+    db.execute('DELETE FROM significance_histograms WHERE date=?', [date])
+    db.execute('''
+        INSERT INTO significance_histograms
+        SELECT date, ''' + columns + ''', COUNT(*) FROM submission_facts WHERE date=?
+        GROUP BY ''' + columns + '''
+    ''', [date])
+
+def import_variant_conflicts(db, date):
+    #the combinations come from the histograms so that the pairs of submissions don't have to be read
+    columns = ', '.join(get_columns(db, 'variant_conflict_facts')[1:])
+    db.execute('DELETE FROM variant_conflict_facts WHERE date=?', [date])
+    db.execute(
+        'INSERT INTO variant_conflict_facts SELECT DISTINCT date, ' + columns + ' FROM histogram_comparisons WHERE date=?',
+        [date]
+    )
+
+def import_file(filename, workers = None, batch_size = 10000, parser = 'elementtree'):
+    workers = workers or cpu_count()
+    chunksize = 100
+
+    #the import is committed all at once so that the website never sees a partially imported month
+    db = connect()
+    cursor = db.cursor()
 
-                WHEN t1.significance=t2.significance THEN 0
-                WHEN t1.normalized_significance="not provided" OR t2.normalized_significance="not provided" THEN 0
+    with open_release(filename) as f, Pool(workers) as pool:
+        chunks = read_chunks(f)
+        header = next(chunks, b'')
+        date = get_release_date(header)
+        if is_temporal(db):
+            forget_date(db, date)
+        previous_date = db.execute('SELECT MAX(date) FROM clinvarset_hashes WHERE date<?', [date]).fetchone()[0]
+        previous_hashes = dict(db.execute('SELECT hash, rcv FROM clinvarset_hashes WHERE date=?', [previous_date]))
+        hashes = []
+        reused = []
+        keys = load_dimensions(db)
 
-                WHEN t1.normalized_significance=t2.normalized_significance THEN 1
+        in_flight = BoundedSemaphore(workers * chunksize * 4)
+        errors = []
+        clinvarsets = get_clinvarsets(chain([header], chunks))
+        hashed_sets = throttle(
+            hash_clinvarsets(clinvarsets, get_hash_key(), previous_hashes, reused), in_flight, errors
+        )
+        results = pool.imap_unordered(partial(parse_hashed, parsers[parser], date), hashed_sets, chunksize)
+        submission_sets = encode_submissions(record_hashes(release(results, in_flight), hashes), keys)
+        import_rows(db, 'submission_facts', submission_sets, batch_size, workers * 2, errors)
 
-                WHEN t1.normalized_significance="benign" AND t2.normalized_significance="likely benign" THEN 2
-                WHEN t1.normalized_significance="likely benign" AND t2.normalized_significance="benign" THEN 2
-                WHEN t1.normalized_significance="pathogenic" AND t2.normalized_significance="likely pathogenic" THEN 2
-                WHEN t1.normalized_significance="likely pathogenic" AND t2.normalized_significance="pathogenic" THEN 2
+    save_dimensions(db, keys)
 
-                WHEN t1.normalized_significance IN ("benign", "likely benign") AND t2.normalized_significance="uncertain significance" THEN 3
-                WHEN t1.normalized_significance="uncertain significance" AND t2.normalized_significance IN ("benign", "likely benign") THEN 3
+    hashes += map(lambda set_hash: (set_hash, previous_hashes[set_hash]), reused)
+    cursor.executemany('INSERT OR REPLACE INTO clinvarset_hashes VALUES (?,?,?)', map(lambda row: (date,) + row, hashes))
+
+    #the reused submissions were matched to an older mondo.owl
+    db.create_function('rematch_mondo', 2, rematch_mondo, deterministic=True)
+    columns = list(map(
+        lambda column: (
+            'rematch_mondo((SELECT name FROM conditions WHERE id=condition_key), condition_xrefs)'
+            if column == 'condition_xrefs' else column
+        ),
+        get_columns(db, 'submission_facts')[1:]
+    ))
+    cursor.execute('''
+        INSERT OR REPLACE INTO submission_facts
+        SELECT ?, ''' + ', '.join(columns) + ''' FROM submission_facts
+        WHERE date=? AND rcv IN (
+            SELECT rcv FROM clinvarset_hashes WHERE date=? AND hash IN (SELECT hash FROM clinvarset_hashes WHERE date=?)
+        )
+    ''', [date, previous_date, date, previous_date])
+
+    if hashes:
+        print(
+            date + ': reused ' + str(len(reused)) + ' of ' + str(len(hashes)) + ' ClinVarSets (' +
+            str(round(100 * len(reused) / len(hashes))) + '%)'
+        )
 
-                WHEN t1.normalized_significance IN ("benign", "likely benign", "uncertain significance") AND t2.normalized_significance IN ("pathogenic", "likely pathogenic") THEN 5
-                WHEN t1.normalized_significance IN ("pathogenic", "likely pathogenic") AND t2.normalized_significance IN ("benign", "likely benign", "uncertain significance") THEN 5
+    if not is_temporal(db):
+        cursor.execute('CREATE INDEX IF NOT EXISTS submissions__date ON submission_facts (date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS submissions__variant_key ON submission_facts (variant_key)')
 
-                ELSE 4
-            END AS conflict_level
-        FROM submissions t1 INNER JOIN submissions t2
-        ON t1.date=? AND t2.date=? AND t1.variant_name=t2.variant_name
-    ''', [date, date])
+    import_comparisons(db, date, workers, batch_size)
 
     for row in list(cursor.execute('SELECT DISTINCT condition_name, condition_xrefs FROM submissions WHERE date=?', [date])):
         clinvar_name = row[0]
@@ -384,14 +1421,116 @@ def import_file(filename):
                 [date, ancestor_id, ancestor_name, clinvar_name]
             )
 
+    #the summaries of a date that is imported again are out of date until create-indexes.py runs
+    cursor.execute('DELETE FROM summaries WHERE date=?', [date])
+
+    db.commit()
+    db.close()
+
+    if is_partitioned():
+        export_partition(date)
+
+def export_partition(date):
+    #the website reads each date from its own file, and clinvar.db only keeps the latest date for the next import
+    db = connect()
+    filename = 'clinvar-' + date + '.db'
+    if exists(filename + '.tmp'):
+        remove(filename + '.tmp')
+
+    db.execute('ATTACH ? AS partition', [filename + '.tmp'])
+    for table in list(dimensions) + ['conflict_levels'] + [
+        'submission_facts',
+        'comparison_facts',
+        'variant_conflict_facts',
+        'significance_histograms',
+        'mondo_clinvar_relationships',
+    ]:
+        sql = db.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", [table]).fetchone()[0]
+        db.execute(sql.replace(table, 'partition.' + table, 1))
+        if table in dimensions or table == 'conflict_levels':
+            db.execute('INSERT INTO partition.' + table + ' SELECT * FROM main.' + table)
+        else:
+            db.execute('INSERT INTO partition.' + table + ' SELECT * FROM main.' + table + ' WHERE date=?', [date])
+    for view in ['submissions', 'comparisons', 'submission_comparisons', 'histogram_comparisons', 'variant_conflicts']:
+        sql = db.execute("SELECT sql FROM sqlite_master WHERE type='view' AND name=?", [view]).fetchone()[0]
+        db.execute(sql.replace(view, 'partition.' + view, 1))
+    db.commit()
+    db.execute('DETACH partition')
+    replace(filename + '.tmp', filename)
+
+    catalog = connect(catalog_filename)
+    catalog.execute('INSERT OR REPLACE INTO partitions VALUES (?,?)', [date, filename])
+    catalog.execute('DELETE FROM summaries WHERE date=?', [date])
+    catalog.commit()
+    catalog.close()
+
+    latest_date = db.execute('SELECT MAX(date) FROM submission_facts').fetchone()[0]
+    for table in [
+        'submission_facts',
+        'comparison_facts',
+        'variant_conflict_facts',
+        'significance_histograms',
+        'mondo_clinvar_relationships',
+        'clinvarset_hashes',
+    ]:
+        db.execute('DELETE FROM ' + table + ' WHERE date<?', [latest_date])
     db.commit()
     db.close()
 
+def check_parsers(filename, workers = None):
+    #runs every parser over every ClinVarSet in a release and reports the sets that they disagree on
+    workers = workers or cpu_count()
+    chunksize = 100
+    mismatches = 0
+
+    with open_release(filename) as f, Pool(workers) as pool:
+        chunks = read_chunks(f)
+        header = next(chunks, b'')
+        date = get_release_date(header)
+        in_flight = BoundedSemaphore(workers * chunksize * 4)
+        clinvarsets = throttle(get_clinvarsets(chain([header], chunks)), in_flight)
+
+        for set_xml in release(pool.imap_unordered(partial(compare_parsers, date), clinvarsets, chunksize), in_flight):
+            if set_xml != None:
+                mismatches += 1
+                print('Parsers disagree on ' + re.search(b'<ClinVarSet [^>]*>', set_xml).group(0).decode('utf-8'))
+
+    print(filename + ': ' + str(mismatches) + ' mismatches')
+    return mismatches
+
 if __name__ == '__main__':
-    if len(argv) < 2:
-        print('Usage: ./import-clinvar-xml.py ClinVarFullRelease_<year>-<month>.xml ...')
-        exit()
+    parser = ArgumentParser()
+    parser.add_argument(
+        'filenames', metavar='ClinVarFullRelease_<year>-<month>.xml[.gz]', nargs='+',
+        help='uncompressed or gzipped release, or - to read from standard input'
+    )
+    parser.add_argument('--workers', type=int, default=cpu_count(), help='number of parser processes')
+    parser.add_argument('--batch-size', type=int, default=10000, help='number of submissions per database write')
+    parser.add_argument(
+        '--parser', choices=parsers.keys(), default='elementtree',
+        help='elementtree builds a tree of each ClinVarSet, expat only looks at the elements that are imported'
+    )
+    parser.add_argument(
+        '--check-parser', action='store_true',
+        help='instead of importing, check that all parsers give the same submissions and exit nonzero if they do not'
+    )
+    parser.add_argument(
+        '--temporal', action='store_true',
+        help='when creating clinvar.db, store each distinct submission and comparison once with the range of dates that it appears in'
+    )
+    parser.add_argument(
+        '--partition', action='store_true',
+        help='write each date to its own clinvar-<date>.db for the website, keeping only the latest date in clinvar.db'
+    )
+    args = parser.parse_args()
+
+    if args.check_parser:
+        mismatches = sum(map(lambda filename: check_parsers(filename, args.workers), args.filenames))
+        sys.exit(1 if mismatches else 0)
 
-    create_tables()
-    for filename in argv[1:]:
-        import_file(filename)
+    if args.partition:
+        create_catalog()
+    create_tables(args.temporal)
+    for filename in args.filenames:
+        import_file(filename, args.workers, args.batch_size, args.parser)
+        update_generation()
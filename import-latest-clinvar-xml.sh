@@ -4,6 +4,5 @@ filename=ClinVarFullRelease_00-latest.xml
 url=ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/xml/$filename.gz
 
 echo Downloading $url
-curl $url | gunzip > $filename 2> /dev/null
-./import-clinvar-xml.py $filename
+curl $url 2> /dev/null | ./import-clinvar-xml.py -
 echo
@@ -0,0 +1,276 @@
+import json
+from collections import OrderedDict
+from fcntl import LOCK_EX, LOCK_NB, LOCK_UN, flock
+from hashlib import sha1
+from os import listdir, makedirs, remove, replace, scandir, utime
+from tempfile import mkstemp
+from threading import Lock, Thread
+from time import monotonic, sleep, time
+
+class ResponseCache():
+    #gzipped pages and their headers, the most used ones in memory and all of them in a directory of shards on disk,
+    #each tier evicting the least recently used pages once its pages add up to more bytes than its size, and expired
+    #pages still being served for up to max_stale seconds while they are rendered again
+    def __init__(self, directory, memory_size, disk_size, large_size, max_stale):
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.large_size = large_size
+        self.max_stale = max_stale
+        self.lock = Lock()
+        self.pages = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.pruning = True
+        self.rendering = {}
+        self.revalidating = set()
+        self.renders = {'rendered': 0, 'coalesced': 0, 'wait_timeouts': 0, 'stale_served': 0, 'revalidated': 0}
+        self.tiers = {
+            'memory': {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_served': 0},
+            'disk': {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_served': 0},
+        }
+        makedirs(directory, exist_ok=True)
+        #the pages that an earlier webserver process left behind count against the size too
+        Thread(target=self.prune, daemon=True).start()
+
+    def filename(self, key):
+        digest = sha1(key.encode()).hexdigest()
+        return self.directory + '/' + digest[0:2] + '/' + digest[2:]
+
+    def get(self, key):
+        #returns the headers, either the body or, for a large body, the open file positioned at the body and its length,
+        #so that the webserver can send it straight from the file, and whether the page has expired
+        now = time()
+        with self.lock:
+            page = self.pages.get(key)
+            if page and (not page[2] or page[2] > now):
+                self.pages.move_to_end(key)
+                self.tiers['memory']['hits'] += 1
+                self.tiers['memory']['bytes_served'] += len(page[1])
+                return page[0], page[1], False
+            if page:
+                self.memory_bytes -= len(self.pages.pop(key)[1])
+            self.tiers['memory']['misses'] += 1
+
+        filename = self.filename(key)
+        try:
+            f = open(filename, 'rb')
+        except OSError:
+            with self.lock:
+                self.tiers['disk']['misses'] += 1
+            return None
+
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = {'key': None}
+        if header['key'] != key or (header['expires'] and header['expires'] + self.max_stale <= now):
+            f.close()
+            with self.lock:
+                self.tiers['disk']['misses'] += 1
+            return None
+
+        try:
+            utime(filename)
+        except OSError:
+            pass
+
+        #an expired page isn't kept in memory, so that once another process has rendered it again the new page is read
+        stale = bool(header['expires']) and header['expires'] <= now
+        if header['length'] > self.large_size:
+            with self.lock:
+                self.tiers['disk']['hits'] += 1
+                self.tiers['disk']['bytes_served'] += header['length']
+                self.renders['stale_served'] += stale
+            return header['headers'], (f, header['length']), stale
+
+        with f:
+            body = f.read()
+        with self.lock:
+            self.tiers['disk']['hits'] += 1
+            self.tiers['disk']['bytes_served'] += len(body)
+            self.renders['stale_served'] += stale
+            if not stale:
+                self.remember(key, header['headers'], body, header['expires'])
+        return header['headers'], body, stale
+
+    def get_or_lock(self, key, timeout):
+        #returns the page, or else a function to call once the page has been rendered and set, so that of the requests
+        #for the same page in every webserver process only one renders it while the others wait for up to the timeout
+        #and then read it from the cache
+        page = self.get(key)
+        if page:
+            return page, None
+
+        release, waited = self.lock_page(key, timeout)
+        if not release:
+            with self.lock:
+                self.renders['wait_timeouts'] += 1
+            return None, None
+
+        if waited:
+            page = self.get(key)
+            if page:
+                release()
+                with self.lock:
+                    self.renders['coalesced'] += 1
+                return page, None
+
+        with self.lock:
+            self.renders['rendered'] += 1
+        return None, release
+
+    def lock_page(self, key, timeout):
+        #returns a function that unlocks the page, or None if it stayed locked for longer than the timeout, and whether
+        #it had to wait
+        deadline = monotonic() + timeout
+        with self.lock:
+            if key not in self.rendering:
+                self.rendering[key] = [Lock(), 0]
+            render_lock = self.rendering[key]
+            render_lock[1] += 1
+            waited = render_lock[0].locked()
+
+        def forget():
+            with self.lock:
+                render_lock[1] -= 1
+                if not render_lock[1]:
+                    del self.rendering[key]
+
+        if not render_lock[0].acquire(timeout=timeout):
+            forget()
+            return None, True
+
+        #pages share a fixed number of lock files, so that any number of pages doesn't leave as many files behind, and
+        #the lock files are never pruned, because a process that opens a new file while another holds the lock on the
+        #deleted one would not wait for it
+        makedirs(self.directory + '/locks', exist_ok=True)
+        f = open(self.directory + '/locks/' + sha1(key.encode()).hexdigest()[0:3], 'a')
+        while True:
+            try:
+                flock(f, LOCK_EX | LOCK_NB)
+                break
+            except BlockingIOError:
+                waited = True
+                if monotonic() > deadline:
+                    f.close()
+                    render_lock[0].release()
+                    forget()
+                    return None, True
+                sleep(0.05)
+
+        def release():
+            flock(f, LOCK_UN)
+            f.close()
+            render_lock[0].release()
+            forget()
+
+        return release, waited
+
+    def start_revalidation(self, key):
+        #only one of a process's requests for an expired page starts rendering it again
+        with self.lock:
+            if key in self.revalidating:
+                return False
+            self.revalidating.add(key)
+            return True
+
+    def finish_revalidation(self, key, revalidated):
+        with self.lock:
+            self.revalidating.discard(key)
+            self.renders['revalidated'] += revalidated
+
+    def has(self, key):
+        #whether the page is cached and hasn't expired
+        now = time()
+        with self.lock:
+            page = self.pages.get(key)
+            if page and (not page[2] or page[2] > now):
+                return True
+        try:
+            with open(self.filename(key), 'rb') as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            return False
+        return header['key'] == key and (not header['expires'] or header['expires'] > now)
+
+    def set(self, key, headers, body, timeout):
+        #zero means the page never expires
+        expires = time() + timeout if timeout else 0
+        header = json.dumps({'key': key, 'expires': expires, 'length': len(body), 'headers': headers}).encode()
+
+        #write the page under a temporary name first so that other processes never read half of it
+        filename = self.filename(key)
+        makedirs(filename[0:filename.rindex('/')], exist_ok=True)
+        fd, temp_filename = mkstemp(dir=self.directory)
+        with open(fd, 'wb') as f:
+            f.write(header + b'\n' + body)
+        replace(temp_filename, filename)
+
+        with self.lock:
+            if len(body) <= self.large_size:
+                self.remember(key, headers, body, expires)
+            self.disk_bytes += len(header) + 1 + len(body)
+            if self.disk_bytes > self.disk_size and not self.pruning:
+                self.pruning = True
+                Thread(target=self.prune, daemon=True).start()
+
+    def remember(self, key, headers, body, expires):
+        #called with the lock held
+        if key in self.pages:
+            self.memory_bytes -= len(self.pages.pop(key)[1])
+        if len(body) > self.memory_size:
+            return
+        self.pages[key] = (headers, body, expires)
+        self.memory_bytes += len(body)
+        while self.memory_bytes > self.memory_size:
+            self.memory_bytes -= len(self.pages.popitem(last=False)[1][1])
+            self.tiers['memory']['evictions'] += 1
+
+    def prune(self):
+        #other webserver processes write to the same directory, so the files themselves are counted instead of trusting
+        #this process's total, and the least recently read or written files are deleted until there is room for more
+        files = []
+        try:
+            for shard in listdir(self.directory):
+                if shard == 'locks':
+                    continue
+                try:
+                    for entry in scandir(self.directory + '/' + shard):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+                except (NotADirectoryError, FileNotFoundError):
+                    pass
+        except OSError:
+            pass
+
+        total = sum(map(lambda f: f[1], files))
+        evictions = 0
+        if total > self.disk_size:
+            files.sort()
+            for mtime, size, path in files:
+                if total <= self.disk_size * 0.9:
+                    break
+                try:
+                    remove(path)
+                    evictions += 1
+                except OSError:
+                    pass
+                total -= size
+
+        with self.lock:
+            self.disk_bytes = total
+            self.tiers['disk']['evictions'] += evictions
+            self.pruning = False
+
+    def statistics(self):
+        with self.lock:
+            ret = {
+                'memory': dict(self.tiers['memory'], bytes=self.memory_bytes, size=self.memory_size),
+                'disk': dict(self.tiers['disk'], bytes=self.disk_bytes, size=self.disk_size),
+                'renders': dict(self.renders),
+            }
+        for tier in [ret['memory'], ret['disk']]:
+            lookups = tier['hits'] + tier['misses']
+            tier['hit_ratio'] = tier['hits'] / lookups if lookups else 0
+        return ret
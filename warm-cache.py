@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import re
+from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import Future
+from multiprocessing import cpu_count, get_context
+from time import monotonic
+from urllib.parse import urlencode, urlparse
+from werkzeug.exceptions import HTTPException
+
+#the filters that visitors most often add to an entity page
+filter_variants = [
+    {},
+    {'min_stars1': 1},
+    {'method1': 'clinical testing'},
+    {'min_conflict_level': 1},
+]
+
+def result(rows):
+    return rows.result() if isinstance(rows, Future) else rows
+
+def entity_urls(miner):
+    from db import DB
+    from flask import url_for
+
+    #the same unfiltered counts that create-indexes.py stores in the summaries table
+    args = {'min_stars': 0, 'min_stars1': 0, 'min_stars2': 0, 'min_conflict_level': -1, 'gene_type': -1}
+
+    urls = list(map(lambda endpoint: url_for(endpoint), [
+        'index',
+        'significance_terms',
+        'total_submissions_by_method',
+        'total_submissions_by_country',
+        'variants_by_significance',
+        'variants_by_gene',
+        'variants_by_submitter',
+        'variants_by_condition',
+        'variants_by_mondo_condition',
+        'variants_in_conflict_by_gene',
+        'variants_in_conflict_by_submitter',
+        'variants_in_conflict_by_condition',
+        'variants_in_conflict_by_significance',
+    ]))
+
+    pages = []
+    conflict_pages = []
+    for row in result(DB().total_variants_by_submitter(**args)):
+        pages.append(url_for('variants_by_submitter', submitter_id=row['submitter_id']))
+        conflict_pages.append(url_for('variants_in_conflict_by_submitter', submitter1_id=row['submitter_id']))
+    for row in result(DB().total_variants_by_gene(**args)):
+        pages.append(url_for('variants_by_gene', gene=row['gene'] or 'intergenic'))
+        conflict_pages.append(url_for('variants_in_conflict_by_gene', gene=row['gene'] or 'intergenic'))
+    for row in result(DB().total_variants_by_condition(**args)):
+        pages.append(url_for('variants_by_condition', condition_name=row['condition_name']))
+        conflict_pages.append(url_for('variants_in_conflict_by_condition', condition_name=row['condition_name']))
+    for row in DB().mondo_conditions():
+        pages.append(url_for('variants_by_mondo_condition', mondo_condition_id=row['mondo_id']))
+    for row in result(DB().total_variants_by_significance(**args)):
+        pages.append(url_for('variants_by_significance', significance=row['significance']))
+    #only the pairs that the conflict overview links to
+    pairs = DB().total_variants_in_conflict_by_significance_and_significance(**dict(args, min_conflict_level=1))
+    for row in result(pairs):
+        conflict_pages.append(url_for(
+            'variants_in_conflict_by_significance',
+            significance1=row['significance1'],
+            significance2=row['significance2'],
+        ))
+
+    #every entity page before any of their filtered variants, and the conflict pages already show only conflicts
+    for filters in filter_variants:
+        suffix = '?' + urlencode(filters) if filters else ''
+        urls += list(map(
+            lambda url: url + suffix,
+            pages if 'min_conflict_level' in filters else pages + conflict_pages
+        ))
+
+    return urls
+
+def log_urls(miner, filenames, script_root):
+    #the app's pages requested in a common or combined format access log, most requested first
+    counts = Counter()
+    for filename in filenames:
+        with open(filename, errors='replace') as f:
+            for line in f:
+                match = re.search(r'"GET ([^ "]+) HTTP/[0-9.]+" 200 ', line)
+                if match and match.group(1).startswith(script_root + '/'):
+                    counts[match.group(1)[len(script_root):]] += 1
+
+    adapter = miner.app.url_map.bind('localhost')
+    def is_page(url):
+        try:
+            return adapter.match(urlparse(url).path)[0] not in ['static', 'robots_txt']
+        except HTTPException:
+            return False
+
+    return list(filter(is_page, map(lambda pair: pair[0], counts.most_common())))
+
+def init_worker(base_url):
+    global miner, url
+    miner = __import__('clinvar-miner')
+    url = base_url
+
+def render(path):
+    #pages that another worker or visitor has already cached are only counted
+    with miner.app.test_request_context(path, base_url=url):
+        endpoint = miner.request.url_rule.endpoint if miner.request.url_rule else None
+        cache = miner.get_cache()
+        if cache and cache.has(miner.cache_key()):
+            return path, endpoint, 'cached', 0
+
+    start = monotonic()
+    response = miner.app.test_client().get(path, base_url=url, headers={'Accept-Encoding': 'gzip'})
+    response.close()
+    return path, endpoint, response.status_code, monotonic() - start
+
+if __name__ == '__main__':
+    parser = ArgumentParser(
+        description='render the pages of every submitter, gene, condition, Mondo condition and significance into the page cache'
+    )
+    parser.add_argument(
+        'base_url', help='address that the website is served at, such as https://example.org/clinvar-miner, because it is part of the cache keys'
+    )
+    parser.add_argument('--workers', type=int, default=cpu_count(), help='number of rendering processes')
+    parser.add_argument('--time-budget', type=float, default=0, help='seconds to stop rendering after, or 0 for no limit')
+    parser.add_argument(
+        '--access-log', action='append', default=[],
+        help='web server access log whose most requested pages are rendered first, may be given more than once'
+    )
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    script_root = urlparse(base_url).path
+    miner = __import__('clinvar-miner')
+    with miner.app.test_request_context('/', base_url=urlparse(base_url)._replace(path='').geturl()):
+        if not miner.get_cache():
+            print('Pages will not be cached because TTL is negative or the database has no generation')
+        urls = list(dict.fromkeys(log_urls(miner, args.access_log, script_root) + entity_urls(miner)))
+
+    print('Rendering ' + str(len(urls)) + ' pages')
+
+    start = monotonic()
+    renders = {}
+    statuses = Counter()
+    #each process gets its own database connections instead of copies of this one's
+    with get_context('spawn').Pool(args.workers, init_worker, [base_url]) as pool:
+        for path, endpoint, status, seconds in pool.imap_unordered(render, urls):
+            statuses[status] += 1
+            if status != 'cached':
+                renders.setdefault(endpoint, []).append([seconds, path])
+            if args.time_budget and monotonic() - start > args.time_budget:
+                print('Stopped after the time budget of ' + str(args.time_budget) + ' seconds')
+                pool.terminate()
+                break
+
+    print(', '.join(map(lambda pair: str(pair[1]) + ' ' + str(pair[0]), sorted(statuses.items(), key=str))))
+    print()
+    print('{:<40} {:>7} {:>10} {:>8} {:>8}'.format('route', 'renders', 'total s', 'mean s', 'max s'))
+    for endpoint, times in sorted(renders.items(), key=lambda pair: -sum(map(lambda t: t[0], pair[1]))):
+        total = sum(map(lambda t: t[0], times))
+        print('{:<40} {:>7} {:>10.1f} {:>8.3f} {:>8.3f}'.format(
+            str(endpoint), len(times), total, total / len(times), max(times)[0]
+        ))
+    print()
+    print('Slowest pages:')
+    for seconds, path in sorted(sum(renders.values(), []), reverse=True)[0:10]:
+        print('{:>8.3f} {}'.format(seconds, path))